@@ -1,23 +1,31 @@
 import os
 import time
 import requests
-import subprocess
 import logging
 import sys
-import math
+import json
 import pika
 import signal
 import socket
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+import policies
+import docker_backend
+import inventory
+import warm_pool
+import metric_sources
 
 
 # ========================
 # CONFIGURATION
 # ========================
 RABBITMQ_API = os.getenv("RABBITMQ_API", "http://localhost:15672/api/queues/%2f/my-queue")
+# Queue depths for all pools come from one call on this base URL (derived from RABBITMQ_API)
+RABBITMQ_MANAGEMENT_URL = os.getenv("RABBITMQ_MANAGEMENT_URL", RABBITMQ_API.split("/api/")[0])
+RABBITMQ_VHOST = os.getenv("RABBITMQ_VHOST", "/")
 RABBITMQ_USER = os.getenv("RABBITMQ_USER", "guest")
 RABBITMQ_PASS = os.getenv("RABBITMQ_PASS", "guest")
+QUEUE_NAME = os.getenv("QUEUE_NAME", "my-queue")
 CONTAINER_NAME_PREFIX = os.getenv("WORKER_PREFIX", "worker")
 IMAGE = os.getenv("WORKER_IMAGE", "my-worker:latest")
 
@@ -30,9 +38,70 @@ COOLDOWN_PERIOD = int(os.getenv("COOLDOWN_PERIOD", "30"))  # seconds
 MESSAGES_PER_WORKER = int(os.getenv("MESSAGES_PER_WORKER", "200"))
 SAFE_MPW = max(1, MESSAGES_PER_WORKER)
 STOP_TIMEOUT = int(os.getenv("STOP_TIMEOUT", "60"))  # seconds to wait before force kill
+INVENTORY_RECONCILE_SECONDS = float(os.getenv("INVENTORY_RECONCILE_SECONDS", "60"))  # relist to catch missed events
+SCALE_CONCURRENCY = max(1, int(os.getenv("SCALE_CONCURRENCY", "4")))  # parallel starts, and parallel drains
+# Worker status endpoint (worker.py): victims for scale-down are picked idle-first and
+# asked to drain before being stopped; 0 disables and falls back to plain stops
+WORKER_STATUS_PORT = int(os.getenv("WORKER_STATUS_PORT", "8081"))
+WORKER_STATUS_TIMEOUT = float(os.getenv("WORKER_STATUS_TIMEOUT", "0.5"))
+# Warm pool: keep this many connected-but-idle standby workers; scale-up activates them first
+WARM_POOL_SIZE = int(os.getenv("WARM_POOL_SIZE", "0"))
+WARM_STANDBY_READY_SECONDS = float(os.getenv("WARM_STANDBY_READY_SECONDS", "5"))  # time for a standby to connect
 COMPOSE_PROJECT = os.getenv("COMPOSE_PROJECT", "myapp")  # or derive from your compose `name:`
 WORKER_COMPOSE_SERVICE = os.getenv("WORKER_COMPOSE_SERVICE", "worker")
 DOCKER_NETWORK = os.getenv("DOCKER_NETWORK", "")
+# "api" talks to the Engine API over DOCKER_SOCKET; "cli" shells out to the docker CLI
+DOCKER_BACKEND = os.getenv("DOCKER_BACKEND", "api")
+DOCKER_SOCKET = os.getenv("DOCKER_SOCKET", "/var/run/docker.sock")
+DOCKER_API_VERSION = os.getenv("DOCKER_API_VERSION", "v1.41")
+
+# Queue metrics: "management" (API with columns= projection, all rates) or "amqp"
+# (passive queue_declare on a persistent connection: ready count and consumers only,
+# no rates, so prefer "management" for the predictive policy). Sampled on a background
+# thread. METRIC_TIMEOUT (capped at POLL_INTERVAL) bounds a whole management API sample,
+# body included; for "amqp" it bounds each queue's round trip
+METRIC_SOURCE = os.getenv("METRIC_SOURCE", "management")
+METRIC_TIMEOUT = min(float(os.getenv("METRIC_TIMEOUT", "2")), POLL_INTERVAL)
+
+# Scaling policy (see policies.py): threshold, target-tracking, pid or predictive.
+# "predictive" sizes the pool from arrival rate and per-worker throughput over a
+# sliding window, falling back to the threshold rules until it has enough data
+SCALING_POLICY = os.getenv("SCALING_POLICY", "predictive")
+PREDICT_WINDOW = int(os.getenv("PREDICT_WINDOW", "60"))  # seconds of samples kept
+PREDICT_MIN_SAMPLES = int(os.getenv("PREDICT_MIN_SAMPLES", "3"))
+WORKER_STARTUP_SECONDS = float(os.getenv("WORKER_STARTUP_SECONDS", "15"))  # lead time until a new worker consumes
+DRAIN_SLO_SECONDS = float(os.getenv("DRAIN_SLO_SECONDS", "60"))  # drain the forecast backlog within this
+WORKER_SERVICE_RATE = float(os.getenv("WORKER_SERVICE_RATE", "0"))  # msgs/s per worker, 0 = measure from acks
+TARGET_BACKLOG_PER_WORKER = float(os.getenv("TARGET_BACKLOG_PER_WORKER", str(SAFE_MPW)))  # target-tracking
+PID_TARGET_DEPTH = float(os.getenv("PID_TARGET_DEPTH", str(SCALE_DOWN_THRESHOLD)))
+PID_KP = float(os.getenv("PID_KP", "1.0"))
+PID_KI = float(os.getenv("PID_KI", "0.05"))
+PID_KD = float(os.getenv("PID_KD", "0.0"))
+
+# Append every observation as a JSON line, replayable with simulator.py --trace
+SAMPLE_LOG = os.getenv("SAMPLE_LOG", "")
+
+# Multi-queue: a JSON file of queue -> worker pool mappings (see pools.example.json).
+# Without it the settings above describe a single pool
+AUTOSCALER_CONFIG = os.getenv("AUTOSCALER_CONFIG", "")
+
+POLICY_CONFIG = {
+    "min_workers": MIN_CONTAINERS,
+    "max_workers": MAX_CONTAINERS,
+    "up_threshold": SCALE_UP_THRESHOLD,
+    "down_threshold": SCALE_DOWN_THRESHOLD,
+    "messages_per_worker": SAFE_MPW,
+    "target_per_worker": TARGET_BACKLOG_PER_WORKER,
+    "target_depth": PID_TARGET_DEPTH,
+    "pid_kp": PID_KP,
+    "pid_ki": PID_KI,
+    "pid_kd": PID_KD,
+    "window": PREDICT_WINDOW,
+    "lead_time": WORKER_STARTUP_SECONDS,
+    "slo": DRAIN_SLO_SECONDS,
+    "worker_rate": WORKER_SERVICE_RATE,
+    "min_samples": PREDICT_MIN_SAMPLES,
+}
 
 def get_container_id():
     """Get the container ID from various sources"""
@@ -76,27 +145,55 @@ logger = logging.getLogger("autoscaler")
 logger.info(f"Autoscaler starting with container ID: {CONTAINER_ID}")
 logger.info(f"Configuration: MIN={MIN_CONTAINERS}, MAX={MAX_CONTAINERS}, Scale Up>={SCALE_UP_THRESHOLD}, Scale Down<={SCALE_DOWN_THRESHOLD}")
 
-# ========================
-# HTTP SESSION WITH RETRIES
-# ========================
-session = requests.Session()
-retries = Retry(
-    total=5,
-    backoff_factor=2,
-    status_forcelist=[500, 502, 503, 504],
-    allowed_methods=["GET"]
-)
-session.mount("http://", HTTPAdapter(max_retries=retries))
-session.mount("https://", HTTPAdapter(max_retries=retries))
-
 # ========================
 # FUNCTIONS
 # ========================
+def load_pool_configs():
+    """Pool settings from AUTOSCALER_CONFIG, each entry defaulting to the env
+    settings; a single pool from the env alone when no file is configured"""
+    if not AUTOSCALER_CONFIG:
+        return [dict(POOL_DEFAULTS, name="default")]
+    with open(AUTOSCALER_CONFIG) as f:
+        entries = json.load(f)["pools"]
+    configs = []
+    for entry in entries:
+        unknown = set(entry) - set(POOL_DEFAULTS) - {"name"}
+        if unknown:
+            raise ValueError(f"Pool '{entry.get('name', entry.get('queue'))}': unknown settings {sorted(unknown)}")
+        config = dict(POOL_DEFAULTS, **entry)
+        config.setdefault("name", config["queue"])
+        configs.append(config)
+    for key in ("name", "queue", "worker_prefix"):
+        values = [c[key] for c in configs]
+        if len(set(values)) != len(values):
+            raise ValueError(f"Every pool needs its own {key}: {values}")
+    return configs
+
+POOL_DEFAULTS = {
+    "queue": QUEUE_NAME,
+    "worker_image": IMAGE,
+    "worker_prefix": CONTAINER_NAME_PREFIX,
+    "min_workers": MIN_CONTAINERS,
+    "max_workers": MAX_CONTAINERS,
+    "scale_up_threshold": SCALE_UP_THRESHOLD,
+    "scale_down_threshold": SCALE_DOWN_THRESHOLD,
+    "messages_per_worker": SAFE_MPW,
+    "cooldown": COOLDOWN_PERIOD,
+    "stop_timeout": STOP_TIMEOUT,
+    "scaling_policy": SCALING_POLICY,
+    "warm_pool_size": WARM_POOL_SIZE,
+    "env": {},  # extra worker env vars
+    "policy": {},  # overrides for POLICY_CONFIG keys, e.g. {"slo": 20, "worker_rate": 4}
+}
+
+POOL_CONFIGS = load_pool_configs()
+
 def ensure_queue_exists():
     try:
         params = pika.ConnectionParameters(
             host=os.getenv("RABBITMQ_HOST", "rabbitmq"),
             port=int(os.getenv("RABBITMQ_PORT", "5672")),
+            virtual_host=RABBITMQ_VHOST,
             credentials=pika.PlainCredentials(
                 os.getenv("RABBITMQ_USER", "guest"),
                 os.getenv("RABBITMQ_PASS", "guest")
@@ -104,126 +201,296 @@ def ensure_queue_exists():
         )
         conn = pika.BlockingConnection(params)
         channel = conn.channel()
-        queue_name = os.getenv("QUEUE_NAME", "my-queue")
-        channel.queue_declare(queue=queue_name, durable=True)
+        for config in POOL_CONFIGS:
+            channel.queue_declare(queue=config["queue"], durable=True)
+            logger.info(f"Ensured queue '{config['queue']}' exists at startup")
         conn.close()
-        logger.info(f"Ensured queue '{queue_name}' exists at startup")
     except Exception as e:
         logger.error(f"ERROR: Failed to ensure queue exists: {e}")
 
-def get_queue_length():
+metric_source = metric_sources.create_source(METRIC_SOURCE, {
+    "api_url": RABBITMQ_MANAGEMENT_URL,
+    "host": os.getenv("RABBITMQ_HOST", "rabbitmq"),
+    "port": int(os.getenv("RABBITMQ_PORT", "5672")),
+    "vhost": RABBITMQ_VHOST,
+    "queues": [config["queue"] for config in POOL_CONFIGS],
+    "user": RABBITMQ_USER,
+    "password": RABBITMQ_PASS,
+    "timeout": METRIC_TIMEOUT,
+    "interval": POLL_INTERVAL,
+})
+sampler = metric_sources.MetricSampler(metric_source, POLL_INTERVAL)
+
+def get_queue_metrics():
+    """Latest {queue: sample} (depth, consumers, publish/deliver/ack rates), or
+    None if the sampler has nothing recent; never waits on the broker"""
+    return sampler.latest(max_age=2 * POLL_INTERVAL + METRIC_TIMEOUT)
+
+docker = docker_backend.create_backend(DOCKER_BACKEND, DOCKER_SOCKET, DOCKER_API_VERSION)
+
+# Starts and drains get separate pools so slow drains (up to STOP_TIMEOUT each)
+# never hold up a scale-up; both are shared by all worker pools
+start_executor = ThreadPoolExecutor(max_workers=SCALE_CONCURRENCY, thread_name_prefix="start")
+drain_executor = ThreadPoolExecutor(max_workers=SCALE_CONCURRENCY, thread_name_prefix="drain")
+draining = set()  # container IDs being stopped in the background
+draining_lock = threading.Lock()
+
+# All our workers, kept current by the Docker events stream; started in main()
+workers = inventory.WorkerInventory(docker, "", ["autoscaler.owner=true"], INVENTORY_RECONCILE_SECONDS)
+
+def draining_count():
+    with draining_lock:
+        return len(draining)
+
+def worker_env(queue_name):
+    # pass RabbitMQ envs to worker (optional but recommended)
+    env = {
+        "PYTHONUNBUFFERED": "1",  # MOST IMPORTANT - prevents log buffering
+        "RABBITMQ_HOST": os.getenv("RABBITMQ_HOST", "rabbitmq"),
+        "RABBITMQ_PORT": os.getenv("RABBITMQ_PORT", "5672"),
+        "RABBITMQ_USER": os.getenv("RABBITMQ_USER", "guest"),
+        "RABBITMQ_PASS": os.getenv("RABBITMQ_PASS", "guest"),
+        "QUEUE_NAME": queue_name,
+    }
+    # worker batch, prefetch and tracing settings, forwarded only when configured here
+    for env_key in ("BATCH_SIZE", "BATCH_LINGER_MS", "BATCH_HANDLER", "ADAPTIVE_PREFETCH",
+                    "PREFETCH_MIN", "PREFETCH_MAX", "PREFETCH_ADJUST_INTERVAL",
+                    "TRACING_EXPORTER", "TRACE_FILE", "OTEL_EXPORTER_OTLP_ENDPOINT",
+                    "TRACE_SAMPLE_RATIO"):
+        if os.getenv(env_key):
+            env[env_key] = os.getenv(env_key)
+    return env
+
+# Compose labels so `down --remove-orphans` cleans them, plus our own ownership label for plan B
+WORKER_LABELS = {
+    "com.docker.compose.project": COMPOSE_PROJECT,
+    "com.docker.compose.service": WORKER_COMPOSE_SERVICE,
+    "autoscaler.owner": "true",
+}
+
+# No retries: a worker that doesn't answer quickly just ranks behind the idle ones
+status_session = requests.Session()
+status_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="status")
+
+def worker_url(container, path):
+    # Container names resolve on the shared compose network
+    return f"http://{container['name']}:{WORKER_STATUS_PORT}{path}"
+
+def get_worker_status(container):
     try:
-        resp = session.get(RABBITMQ_API, auth=(RABBITMQ_USER, RABBITMQ_PASS), timeout=5)
+        resp = status_session.get(worker_url(container, "/status"), timeout=WORKER_STATUS_TIMEOUT)
         resp.raise_for_status()
-        return resp.json().get("messages", 0)
+        return resp.json()
+    except Exception:
+        return None
+
+def choose_victims(containers, count):
+    """Idle workers first (longest idle first), then ones we couldn't ask, then
+    busy ones with the least work in flight"""
+    if not WORKER_STATUS_PORT:
+        return containers[:count]
+    statuses = list(status_executor.map(get_worker_status, containers))
+
+    def rank(item):
+        status = item[1]
+        if status is None:
+            return (1, 0)
+        if status.get("state") == "idle":
+            return (0, -status.get("idle_seconds", 0))
+        return (2, status.get("in_flight", 0))
+
+    ranked = sorted(zip(containers, statuses), key=rank)
+    summary = ", ".join(f"{c['id']}={s['state'] if s else 'unknown'}" for c, s in ranked[:count])
+    logger.info(f"Scale-down victims: {summary}")
+    return [c for c, _ in ranked[:count]]
+
+def request_worker_drain(container):
+    try:
+        resp = status_session.post(worker_url(container, "/drain"), timeout=max(1.0, WORKER_STATUS_TIMEOUT))
+        resp.raise_for_status()
+        return True
     except Exception as e:
-        logger.error(f"ERROR: Failed to fetch queue length: {e}")
-        return 0
+        logger.info(f"Worker {container['id']} did not accept a drain request ({e}); stopping it instead")
+        return False
 
-def get_running_workers():
+def drain_worker(container, stop_timeout):
+    """Ask the worker to stop consuming and exit once its in-flight work is
+    settled, falling back to stop (SIGTERM, then kill after stop_timeout); then
+    remove it. Runs on drain_executor."""
+    cid = container["id"]
+    started = time.time()
     try:
-        result = subprocess.run(
-            ["docker", "ps", "--filter", f"name={CONTAINER_NAME_PREFIX}", "--format", "{{.ID}}"],
-            stdout=subprocess.PIPE, text=True, check=True
-        )
-        workers = result.stdout.strip().splitlines()
-        return workers if workers else []
-    except subprocess.CalledProcessError as e:
-        logger.error(f"ERROR: Failed to list running containers: {e}")
-        return []
-
-def scale_workers(desired_count):
-    current_workers = get_running_workers()
-    current_count = len(current_workers)
-    changed = False
-
-    if desired_count > current_count:
-        scale_up = desired_count - current_count
-        logger.info(f"Scaling UP: Adding {scale_up} workers")
-        for i in range(scale_up):
-            name = f"{CONTAINER_NAME_PREFIX}-{int(time.time())}-{i}"
-            try:
-                run_cmd = ["docker", "run", "-d", "--name", name]
-                # # 1. Start container with primary network (appnet)
-                # run_cmd += ["--network", "myapp_appnet"]
-                if DOCKER_NETWORK:
-                    run_cmd += ["--network", DOCKER_NETWORK]
-                # Compose labels so `down --remove-orphans` cleans them
-                run_cmd += ["--label", f"com.docker.compose.project={COMPOSE_PROJECT}",
-                            "--label", f"com.docker.compose.service={WORKER_COMPOSE_SERVICE}",
-                            "--label", "autoscaler.owner=true"]  # our own ownership label for plan B
-
-                # pass RabbitMQ envs to worker (optional but recommended)
-                essential_env_vars = {
-                    "PYTHONUNBUFFERED": "1",  # MOST IMPORTANT - prevents log buffering
-                    "RABBITMQ_HOST": os.getenv("RABBITMQ_HOST", "rabbitmq"),
-                    "RABBITMQ_PORT": os.getenv("RABBITMQ_PORT", "5672"),
-                    "RABBITMQ_USER": os.getenv("RABBITMQ_USER", "guest"),
-                    "RABBITMQ_PASS": os.getenv("RABBITMQ_PASS", "guest"),
-                    "QUEUE_NAME": os.getenv("QUEUE_NAME", "my-queue"),
-                }                
-                for env_key, env_value in essential_env_vars.items():
-                    run_cmd += ["-e", f"{env_key}={env_value}"]
-                # # optional: restart policy
-                # run_cmd += ["--restart","unless-stopped"]
-                run_cmd.append(IMAGE)
-                subprocess.run(run_cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                logger.info(f"Started container {name}")
-                # # 2. Connect to logging network separately
-                # try:
-                #     subprocess.run(
-                #         ["docker", "network", "connect", "myapp_logging", name],
-                #         check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-                #     )
-                #     logger.info(f"Connected {name} to logging network")
-                # except subprocess.CalledProcessError as e:
-                #     logger.warning(f"Failed to connect {name} to logging network: {e}")
+        if WORKER_STATUS_PORT and request_worker_drain(container):
+            if docker.wait_container(cid, stop_timeout):
+                logger.info(f"Worker {cid} drained and exited in {time.time() - started:.1f}s")
+        # No-op for an exited container; otherwise whatever is left of stop_timeout
+        docker.stop_container(cid, max(1, int(stop_timeout - (time.time() - started))))
+        docker.remove_container(cid)
+        workers.remove(cid)
+        logger.info(f"Gracefully stopped & removed container {cid}")
+    except docker_backend.DockerError as e:
+        logger.error(f"ERROR: Failed to stop/remove container {cid}: {e}")
+    finally:
+        with draining_lock:
+            draining.discard(cid)
+
+class WorkerPool:
+    """One queue and the worker containers consuming it, with its own policy,
+    limits, cooldown and warm pool"""
+
+    def __init__(self, config):
+        self.name = config["name"]
+        self.queue = config["queue"]
+        self.image = config["worker_image"]
+        self.prefix = config["worker_prefix"]
+        self.min_workers = config["min_workers"]
+        self.cooldown = config["cooldown"]
+        self.stop_timeout = config["stop_timeout"]
+        self.extra_env = {k: str(v) for k, v in config["env"].items()}
+        self.labels = dict(WORKER_LABELS, **{"autoscaler.pool": self.name})
+        policy_config = dict(POLICY_CONFIG, min_workers=config["min_workers"], max_workers=config["max_workers"],
+                             up_threshold=config["scale_up_threshold"],
+                             down_threshold=config["scale_down_threshold"],
+                             messages_per_worker=max(1, config["messages_per_worker"]), **config["policy"])
+        self.policy = policies.build_policy(config["scaling_policy"], policy_config)
+        self.warm = warm_pool.WarmPool(docker, workers, self.prefix, config["warm_pool_size"],
+                                       WARM_STANDBY_READY_SECONDS,
+                                       lambda name, extra_env: self.start_worker(name, dict(self.worker_env(),
+                                                                                            **extra_env)),
+                                       start_executor, owns=self.owns)
+        self.last_scale_time = 0
+        self.last_sample_time = None
+
+    def owns(self, container):
+        pool = container["labels"].get("autoscaler.pool")
+        # Workers started before pools were labelled are matched by name
+        return pool == self.name if pool else container["name"].startswith(self.prefix)
+
+    def running_containers(self):
+        """Running workers that are not being drained or on standby, from the in-memory inventory"""
+        running = [c for c in workers.running() if self.owns(c) and not self.warm.is_standby(c)]
+        with draining_lock:
+            return [c for c in running if c["id"] not in draining]
+
+    def worker_env(self):
+        return dict(worker_env(self.queue), **self.extra_env)
+
+    def start_worker(self, name, env):
+        """Create and start one worker container; runs on start_executor"""
+        container_id = docker.run_container(name, self.image, env=env, labels=self.labels,
+                                            network=DOCKER_NETWORK or None)
+        # Count it right away rather than when its start event arrives
+        workers.add({"id": container_id, "name": name, "state": "running", "labels": dict(self.labels)})
+        logger.info(f"[{self.name}] Started container {name} ({container_id})")
+        return container_id
+
+    def scale(self, desired_count):
+        """Start missing workers in parallel and wait for them; hand surplus workers to
+        background drains. Returns whether anything changed."""
+        current_workers = self.running_containers()
+        current_count = len(current_workers)
+        changed = False
+
+        if desired_count > current_count:
+            scale_up = desired_count - current_count
+            logger.info(f"[{self.name}] Scaling UP: Adding {scale_up} workers")
+            activated = self.warm.take(scale_up)
+            if activated:
                 changed = True
-            except FileNotFoundError:
-                logger.error("ERROR: Docker CLI not found. Install docker-cli or use Docker SDK.")
-                return False
-            except subprocess.CalledProcessError as e:
-                logger.error(f"ERROR: Failed to start container {name}: {e}")
-
-    elif desired_count < current_count:
-        scale_down = current_count - desired_count
-        to_remove = current_workers[:scale_down]
-        logger.info(f"Scaling DOWN: Removing {scale_down} workers")
-        for cid in to_remove:
+                scale_up -= len(activated)
+                logger.info(f"[{self.name}] Activated {len(activated)} warm standby workers, cold-starting {scale_up}")
+            env = self.worker_env()
+            stamp = int(time.time())
+            futures = {start_executor.submit(self.start_worker, f"{self.prefix}-{stamp}-{i}", env):
+                       f"{self.prefix}-{stamp}-{i}" for i in range(scale_up)}
+            wait(futures)
+            for future, name in futures.items():
+                try:
+                    future.result()
+                    changed = True
+                except docker_backend.DockerUnavailable as e:
+                    logger.error(f"ERROR: {e}")
+                except docker_backend.DockerError as e:
+                    logger.error(f"ERROR: [{self.name}] Failed to start container {name}: {e}")
+            self.warm.refill()
+
+        elif desired_count < current_count:
+            scale_down = current_count - desired_count
+            to_remove = choose_victims(current_workers, scale_down)
+            logger.info(f"[{self.name}] Scaling DOWN: Draining {len(to_remove)} workers in the background")
+            with draining_lock:
+                draining.update(c["id"] for c in to_remove)
+            for container in to_remove:
+                drain_executor.submit(drain_worker, container, self.stop_timeout)
+            changed = bool(to_remove)
+
+        return changed
+
+    def tick(self, samples):
+        """One control-loop pass for this pool over the latest samples"""
+        observation = samples.get(self.queue)
+        if observation is None or observation["time"] == self.last_sample_time:
+            # Don't act on a missing or repeated sample; a broker outage is not an empty queue
+            logger.info(f"[{self.name}] No fresh sample for queue '{self.queue}', skipping this poll")
+            return
+        self.last_sample_time = observation["time"]
+        logger.info(f"[{self.name}] Queue length: {observation['messages']}")
+
+        current_count = len(self.running_containers())
+        observation["workers"] = current_count
+        self.warm.refill()
+
+        if SAMPLE_LOG:
             try:
-                subprocess.run(["docker","stop",f"--time={STOP_TIMEOUT}",cid],
-                               check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                subprocess.run(["docker","rm",cid], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                logger.info(f"Gracefully stopped & removed container {cid}")
-                changed = True
-            except FileNotFoundError:
-                logger.error("ERROR: Docker CLI not found. Install docker-cli or use Docker SDK.")
-                return False
-            except subprocess.CalledProcessError as e:
-                logger.error(f"ERROR: Failed to stop/remove container {cid}: {e}")
+                with open(SAMPLE_LOG, "a") as f:
+                    f.write(json.dumps(observation) + "\n")
+            except OSError as e:
+                logger.warning(f"ERROR: Failed to write sample log: {e}")
+
+        desired_count, reason = self.policy.decide(observation)
+        if desired_count is None:
+            desired_count = max(current_count, self.min_workers)
+        logger.info(f"[{self.name}] Policy {self.policy.name}: {reason} -> {desired_count} workers")
+
+        now = time.time()
+        if desired_count != current_count:
+            if now - self.last_scale_time < self.cooldown:
+                logger.info(f"[{self.name}] Cooldown active, skipping scale action")
+            else:
+                logger.info(f"[{self.name}] Scaling from {current_count} to {desired_count} workers")
+                changed = self.scale(desired_count)
+                if changed:
+                    self.last_scale_time = now
+                else:
+                    logger.info(f"[{self.name}] No containers changed; not starting cooldown so we can retry next poll.")
 
-    return changed
+pools = [WorkerPool(config) for config in POOL_CONFIGS]
+# One thread per pool so a slow scale action in one pool doesn't delay the others
+pool_executor = ThreadPoolExecutor(max_workers=len(pools), thread_name_prefix="pool")
 
 def cleanup_dynamic_workers():
     try:
-        # match both our owner label and the name prefix
-        result = subprocess.run(
-            ["docker","ps","-aq",
-             "--filter", "label=autoscaler.owner=true",
-             "--filter", f"name={CONTAINER_NAME_PREFIX}"],
-            stdout=subprocess.PIPE, text=True, check=True
-        )
-        ids = [i for i in result.stdout.splitlines() if i]
+        # match both our owner label and a pool's name prefix
+        ids = set()
+        for pool in pools:
+            ids.update(c["id"] for c in docker.list_containers(name=pool.prefix, labels=["autoscaler.owner=true"],
+                                                              all=True))
         if ids:
             logger.info(f"Cleaning up {len(ids)} dynamic workers")
-            for cid in ids:
+
+            def stop_and_remove(cid):
                 try:
-                    subprocess.run(["docker","stop", f"--time={STOP_TIMEOUT}", cid],
-                                check=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                    subprocess.run(["docker","rm", cid],
-                                check=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                except Exception:
+                    docker.stop_container(cid, STOP_TIMEOUT)
+                except docker_backend.DockerError:
                     pass
+                try:
+                    docker.remove_container(cid, force=True)
+                except docker_backend.DockerError:
+                    pass
+
+            # Own pool: this runs from the signal handler while drains may occupy drain_executor
+            with ThreadPoolExecutor(max_workers=SCALE_CONCURRENCY) as cleanup_pool:
+                list(cleanup_pool.map(stop_and_remove, ids))
         else:
             logger.info("No dynamic workers to clean up")
         logger.info(f"Cleaned up {len(ids)} dynamic workers")
@@ -249,44 +516,32 @@ signal.signal(signal.SIGUSR1, _handle_sigusr1)
 # MAIN LOOP
 # ========================
 def main():
-    DOWN_STREAK = 0
-
     logger.info("RabbitMQ Docker Autoscaler started")
+    for pool in pools:
+        logger.info(f"Pool '{pool.name}': queue '{pool.queue}', image {pool.image}, "
+                    f"{pool.min_workers}-{pool.policy.max_workers} workers, policy {pool.policy.name}")
+    logger.info(f"Docker backend: {docker.name}")
     ensure_queue_exists()
-
-    last_scale_time = 0
+    workers.start()
+    logger.info(f"Worker inventory seeded: {len(workers.running())} running workers")
+    sampler.start(timeout=METRIC_TIMEOUT)
+    logger.info(f"Sampling {len(pools)} queues from {metric_source.name} every {POLL_INTERVAL}s")
 
     while True:
-        queue_length = get_queue_length()
-        logger.info(f"Queue length: {queue_length}")
-        
-        if queue_length <= SCALE_DOWN_THRESHOLD:
-            DOWN_STREAK += 1
-        else:
-            DOWN_STREAK = 0
+        samples = get_queue_metrics()
+        if samples is None:
+            # Don't act on a missing sample; a broker outage is not an empty queue
+            logger.info(f"No fresh queue samples, skipping this poll ({sampler.get_stats()})")
+            time.sleep(POLL_INTERVAL)
+            continue
+        if draining_count():
+            logger.info(f"{draining_count()} workers draining in the background")
 
-        current_workers = get_running_workers()
-        current_count = len(current_workers)
-        desired_count = max(current_count, MIN_CONTAINERS)
-
-        if queue_length >= SCALE_UP_THRESHOLD and current_count < MAX_CONTAINERS:
-            desired_count = min(MAX_CONTAINERS, max(MIN_CONTAINERS, math.ceil(queue_length / SAFE_MPW)))
-        elif queue_length <= SCALE_DOWN_THRESHOLD and current_count > MIN_CONTAINERS:
-            desired_count = max(MIN_CONTAINERS, math.ceil(queue_length / SAFE_MPW))
-        elif DOWN_STREAK >= 3 and current_count > MIN_CONTAINERS:
-            desired_count = max(MIN_CONTAINERS, math.ceil(queue_length / SAFE_MPW))
-
-        now = time.time()
-        if desired_count != current_count:
-            if now - last_scale_time < COOLDOWN_PERIOD:
-                logger.info("Cooldown active, skipping scale action")
-            else:
-                logger.info(f"Scaling from {current_count} to {desired_count} workers")
-                changed = scale_workers(desired_count)
-                if changed:
-                    last_scale_time = now
-                else:
-                    logger.info("No containers changed; not starting cooldown so we can retry next poll.")
+        futures = {pool_executor.submit(pool.tick, samples): pool for pool in pools}
+        wait(futures)
+        for future, pool in futures.items():
+            if future.exception():
+                logger.error(f"ERROR: [{pool.name}] Scaling pass failed: {future.exception()}")
 
         time.sleep(POLL_INTERVAL)
 
@@ -0,0 +1,144 @@
+"""In-memory inventory of the autoscaler's worker containers.
+
+Seeded with one container list, then kept current from the Docker events
+stream (start/die/destroy/rename for containers carrying the owner label),
+so the control loop reads worker counts from local state instead of listing
+containers every poll. A reconcile pass relists periodically to catch
+anything the stream missed; if the stream drops, the inventory is reseeded
+and the stream resumed from just before the reseed.
+"""
+import logging
+import threading
+import time
+
+import docker_backend
+
+logger = logging.getLogger("autoscaler")
+
+EVENT_ACTIONS = ("start", "die", "destroy", "rename")
+
+class WorkerInventory:
+    def __init__(self, docker, name_prefix, labels, reconcile_interval=60.0):
+        self.docker = docker
+        self.name_prefix = name_prefix
+        self.labels = list(labels)
+        self.reconcile_interval = reconcile_interval
+        self.containers = {}  # id -> container dict
+        self.lock = threading.Lock()
+        self.events_applied = 0
+        self.changes = 0  # any local update; reconcile skips a listing that raced one
+        self.reconcile_fixes = 0
+        self.stream_restarts = 0
+        self.synced = threading.Event()
+
+    def _list(self):
+        containers = self.docker.list_containers(name=self.name_prefix, labels=self.labels)
+        # "started" approximates when the container came up, for warm-pool readiness
+        return {c["id"]: dict(c, started=c.get("created", 0)) for c in containers}
+
+    def seed(self):
+        """Replace the inventory with a fresh listing; returns the time it was taken"""
+        since = time.time() - 1  # overlap with the event stream; replaying an event is harmless
+        containers = self._list()
+        with self.lock:
+            # Known containers keep their start time; "created" is only an approximation
+            for container_id, container in containers.items():
+                if container_id in self.containers:
+                    container["started"] = self.containers[container_id]["started"]
+            self.containers = containers
+            self.changes += 1
+        self.synced.set()
+        return since
+
+    def apply(self, event):
+        if not event["name"].startswith(self.name_prefix):
+            return
+        with self.lock:
+            self.events_applied += 1
+            self.changes += 1
+            if event["action"] == "start":
+                self.containers.setdefault(event["id"], {"id": event["id"], "name": event["name"],
+                                                         "state": "running", "labels": event["labels"],
+                                                         "started": event["time"]})
+            elif event["action"] == "rename":
+                if event["id"] in self.containers:
+                    self.containers[event["id"]]["name"] = event["name"]
+            else:
+                self.containers.pop(event["id"], None)
+
+    def add(self, container):
+        """Record a container we just started, ahead of its start event"""
+        with self.lock:
+            self.containers[container["id"]] = dict(container, started=time.time())
+            self.changes += 1
+
+    def rename(self, container_id, name):
+        with self.lock:
+            if container_id in self.containers:
+                self.containers[container_id]["name"] = name
+            self.changes += 1
+
+    def remove(self, container_id):
+        with self.lock:
+            self.containers.pop(container_id, None)
+            self.changes += 1
+
+    def running(self):
+        """Running containers (copies), oldest entries first"""
+        with self.lock:
+            return [dict(c) for c in self.containers.values() if c["state"] == "running"]
+
+    def reconcile(self):
+        """Merge a fresh listing into the inventory: add what is missing, drop
+        what is gone, and keep known entries (and their start times) as they are"""
+        with self.lock:
+            changes = self.changes
+        listed = self._list()
+        with self.lock:
+            if self.changes != changes:
+                return  # events or our own starts/renames raced the listing; check next pass
+            missing = listed.keys() - self.containers.keys()
+            stale = self.containers.keys() - listed.keys()
+            renamed = [container_id for container_id in listed.keys() & self.containers.keys()
+                       if listed[container_id]["name"] != self.containers[container_id]["name"]]
+            for container_id in missing:
+                self.containers[container_id] = listed[container_id]
+            for container_id in stale:
+                del self.containers[container_id]
+            for container_id in renamed:
+                self.containers[container_id]["name"] = listed[container_id]["name"]
+            if missing or stale or renamed:
+                self.reconcile_fixes += len(missing) + len(stale) + len(renamed)
+                logger.warning(f"Inventory drift: {len(missing)} missing, {len(stale)} stale, "
+                               f"{len(renamed)} renamed; resynced")
+
+    def _watch(self):
+        while True:
+            try:
+                since = self.seed()
+                for event in self.docker.events(self.labels, EVENT_ACTIONS, since=since):
+                    self.apply(event)
+            except docker_backend.DockerError as e:
+                logger.error(f"ERROR: Docker event stream failed: {e}")
+            self.stream_restarts += 1
+            time.sleep(1)
+
+    def _reconcile_loop(self):
+        while True:
+            time.sleep(self.reconcile_interval)
+            try:
+                self.reconcile()
+            except docker_backend.DockerError as e:
+                logger.error(f"ERROR: Inventory reconcile failed: {e}")
+
+    def start(self, timeout=10.0):
+        """Start the event watcher and reconciler; waits for the first seed"""
+        threading.Thread(target=self._watch, name="inventory-events", daemon=True).start()
+        threading.Thread(target=self._reconcile_loop, name="inventory-reconcile", daemon=True).start()
+        if not self.synced.wait(timeout):
+            logger.warning("Worker inventory not seeded yet; counts may be low until Docker answers")
+
+    def get_stats(self):
+        with self.lock:
+            return {"workers": len(self.containers), "events_applied": self.events_applied,
+                    "reconcile_fixes": self.reconcile_fixes, "stream_restarts": self.stream_restarts}
@@ -0,0 +1,202 @@
+"""Queue metric sources for the autoscaler.
+
+Every source watches a list of queues; sample() returns {queue: observation}
+with an observation dict (time, queue, messages, consumers, publish_rate,
+deliver_rate, ack_rate; see policies.py) per queue that exists, or raises.
+
+    ManagementAPISource  one GET per sample for all queues of the vhost,
+                         projected with columns= to the handful of fields we
+                         use, on a keep-alive session without retries; the
+                         whole sample, body included, ends within the timeout
+    AmqpPassiveSource    passive queue_declare per queue on a persistent AMQP
+                         connection: one round trip each, but only the ready
+                         count and consumers; rates are reported as 0
+
+MetricSampler runs a source on its own thread so the control loop only ever
+reads the latest sample from memory; a slow or hung broker ages the sample
+out instead of stalling the loop.
+"""
+import json
+import logging
+import math
+import threading
+import time
+import urllib.parse
+
+import pika
+import requests
+
+logger = logging.getLogger("autoscaler")
+
+QUEUE_COLUMNS = ",".join((
+    "name",
+    "messages",
+    "consumers",
+    "message_stats.publish_details.rate",
+    "message_stats.deliver_get_details.rate",
+    "message_stats.ack_details.rate",
+))
+
+def _rate(stats, key):
+    # Rate fields are missing until the queue has seen that kind of traffic
+    return float((stats.get(key) or {}).get("rate", 0.0))
+
+class ManagementAPISource:
+    name = "management"
+
+    def __init__(self, base_url, vhost, queues, user, password, timeout):
+        self.url = f"{base_url.rstrip('/')}/api/queues/{urllib.parse.quote(vhost, safe='')}"
+        self.queues = set(queues)
+        self.auth = (user, password)
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _fetch(self):
+        """GET the queue list within self.timeout overall. A per-socket timeout alone
+        lets a body that keeps trickling in run on indefinitely, so every socket wait
+        gets half the budget and no read starts after the first half has passed."""
+        budget = self.timeout / 2
+        deadline = time.monotonic() + budget
+        with self.session.get(self.url, params={"columns": QUEUE_COLUMNS}, auth=self.auth,
+                              timeout=budget, stream=True) as resp:
+            resp.raise_for_status()
+            chunks = []
+            while True:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Management API response took longer than {self.timeout:g}s")
+                # read1 returns what has arrived; read(n) would block until all n bytes are in
+                chunk = resp.raw.read1(64 * 1024, decode_content=True)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        return json.loads(b"".join(chunks))
+
+    def sample(self):
+        queues = self._fetch()
+        now = time.time()
+        samples = {}
+        for data in queues:
+            if data.get("name") not in self.queues:
+                continue
+            stats = data.get("message_stats") or {}
+            samples[data["name"]] = {
+                "time": now,
+                "queue": data["name"],
+                "messages": data.get("messages", 0),
+                "consumers": data.get("consumers", 0),
+                "publish_rate": _rate(stats, "publish_details"),
+                "deliver_rate": _rate(stats, "deliver_get_details"),
+                "ack_rate": _rate(stats, "ack_details"),
+            }
+        return samples
+
+class AmqpPassiveSource:
+    """message_count from Declare-Ok counts ready messages only (no unacked),
+    so depth reads lower than the management API's while workers are busy"""
+    name = "amqp"
+
+    def __init__(self, host, port, vhost, queues, user, password, timeout, interval):
+        # The BlockingConnection only does I/O while sampling, so heartbeats are serviced
+        # once per poll; the heartbeat must outlast a whole poll interval idle
+        self.params = pika.ConnectionParameters(
+            host=host, port=port, virtual_host=vhost, credentials=pika.PlainCredentials(user, password),
+            socket_timeout=timeout, stack_timeout=timeout, blocked_connection_timeout=timeout,
+            heartbeat=max(10, math.ceil(3 * interval)))
+        self.queues = list(queues)
+        self.connection = None
+        self.channel = None
+
+    def _ensure_channel(self):
+        if self.connection is None or self.connection.is_closed:
+            self.connection = pika.BlockingConnection(self.params)
+            self.channel = None
+        if self.channel is None or self.channel.is_closed:
+            self.channel = self.connection.channel()
+        return self.channel
+
+    def sample(self):
+        samples = {}
+        for queue_name in self.queues:
+            try:
+                declare_ok = self._ensure_channel().queue_declare(queue=queue_name, durable=True, passive=True)
+            except pika.exceptions.ChannelClosedByBroker:
+                # 404: the queue doesn't exist (yet); the broker closed only the channel
+                self.channel = None
+                continue
+            except Exception:
+                self.close()
+                raise
+            samples[queue_name] = {
+                "time": time.time(),
+                "queue": queue_name,
+                "messages": declare_ok.method.message_count,
+                "consumers": declare_ok.method.consumer_count,
+                "publish_rate": 0.0,
+                "deliver_rate": 0.0,
+                "ack_rate": 0.0,
+            }
+        return samples
+
+    def close(self):
+        if self.connection is not None and self.connection.is_open:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+        self.connection = None
+        self.channel = None
+
+class MetricSampler:
+    def __init__(self, source, interval):
+        self.source = source
+        self.interval = interval
+        self.latest_sample = None  # ({queue: observation}, time.time() it was taken), swapped as one
+        self.last_error = None
+        self.samples = 0
+        self.failures = 0
+        self.last_duration = None
+        self.updated = threading.Event()
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                self.latest_sample = (self.source.sample(), time.time())
+                self.samples += 1
+                self.last_error = None
+            except Exception as e:
+                self.failures += 1
+                if str(e) != self.last_error:
+                    logger.error(f"ERROR: Failed to sample queue metrics from {self.source.name}: {e}")
+                self.last_error = str(e)
+            self.last_duration = time.monotonic() - started
+            self.updated.set()
+            time.sleep(max(0.0, self.interval - self.last_duration))
+
+    def start(self, timeout=None):
+        """Start sampling; waits up to `timeout` for the first attempt"""
+        threading.Thread(target=self._run, name=f"metrics-{self.source.name}", daemon=True).start()
+        self.updated.wait(timeout)
+
+    def latest(self, max_age):
+        """The newest {queue: observation} (copies), or None if there is none younger than max_age"""
+        latest_sample = self.latest_sample
+        if latest_sample is None:
+            return None
+        sample, sampled_at = latest_sample
+        if time.time() - sampled_at > max_age:
+            return None
+        return {queue: dict(observation) for queue, observation in sample.items()}
+
+    def get_stats(self):
+        return {"source": self.source.name, "samples": self.samples, "failures": self.failures,
+                "last_duration_ms": round(self.last_duration * 1000, 3) if self.last_duration is not None else None}
+
+def create_source(name, config):
+    if name == "management":
+        return ManagementAPISource(config["api_url"], config["vhost"], config["queues"], config["user"],
+                                   config["password"], config["timeout"])
+    if name == "amqp":
+        return AmqpPassiveSource(config["host"], config["port"], config["vhost"], config["queues"], config["user"],
+                                 config["password"], config["timeout"], config["interval"])
+    raise ValueError(f"Unknown metric source '{name}', use 'management' or 'amqp'")
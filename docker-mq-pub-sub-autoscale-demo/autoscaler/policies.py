@@ -0,0 +1,225 @@
+"""Scaling policies for the autoscaler and the offline simulator.
+
+Every policy gets one observation per poll and returns the desired worker
+count (or None to keep the current one) plus a short reason for the log.
+An observation is a dict:
+
+    time          seconds (any monotonic origin)
+    messages      queue depth (ready + unacked)
+    publish_rate  msgs/s arriving
+    deliver_rate  msgs/s handed to consumers
+    ack_rate      msgs/s acknowledged
+    workers       running workers
+
+Policies hold only their own state, take all tuning as constructor
+arguments and never read the environment, so the simulator can run them
+exactly as autoscale.py does. Cooldown is applied by the caller.
+"""
+import math
+from collections import deque
+
+class ScalingPolicy:
+    name = "base"
+
+    def __init__(self, min_workers, max_workers):
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+
+    def clamp(self, count):
+        return min(self.max_workers, max(self.min_workers, int(count)))
+
+    def decide(self, observation):
+        """Return (desired_count or None, reason)"""
+        raise NotImplementedError
+
+class ThresholdPolicy(ScalingPolicy):
+    """The original reactive rules: size to backlog / messages_per_worker once
+    up_threshold is reached, shrink at or below down_threshold"""
+    name = "threshold"
+
+    def __init__(self, min_workers, max_workers, up_threshold, down_threshold, messages_per_worker, down_streak=3):
+        super().__init__(min_workers, max_workers)
+        self.up_threshold = up_threshold
+        self.down_threshold = down_threshold
+        self.messages_per_worker = max(1, messages_per_worker)
+        self.down_streak = down_streak
+        self.streak = 0
+
+    def decide(self, observation):
+        queue_length = observation["messages"]
+        current_count = observation["workers"]
+        if queue_length <= self.down_threshold:
+            self.streak += 1
+        else:
+            self.streak = 0
+
+        sized = math.ceil(queue_length / self.messages_per_worker)
+        desired_count = max(current_count, self.min_workers)
+        if queue_length >= self.up_threshold and current_count < self.max_workers:
+            desired_count = self.clamp(sized)
+        elif queue_length <= self.down_threshold and current_count > self.min_workers:
+            desired_count = max(self.min_workers, sized)
+        elif self.streak >= self.down_streak and current_count > self.min_workers:
+            desired_count = max(self.min_workers, sized)
+        return desired_count, f"depth={queue_length}"
+
+class TargetTrackingPolicy(ScalingPolicy):
+    """Keep backlog per worker at `target_per_worker`, like a cloud target-tracking
+    policy: scale out proportionally at once, scale in only when the metric is
+    more than `scale_in_margin` below target for `down_streak` polls"""
+    name = "target-tracking"
+
+    def __init__(self, min_workers, max_workers, target_per_worker, scale_in_margin=0.1, down_streak=3):
+        super().__init__(min_workers, max_workers)
+        self.target = max(1e-9, target_per_worker)
+        self.scale_in_margin = scale_in_margin
+        self.down_streak = down_streak
+        self.lower = 0
+
+    def decide(self, observation):
+        depth = observation["messages"]
+        current_count = observation["workers"]
+        per_worker = depth / current_count if current_count else float(depth)
+        desired = self.clamp(math.ceil(depth / self.target))
+        reason = f"backlog/worker={per_worker:.1f} target={self.target:g}"
+        if desired > current_count:
+            self.lower = 0
+            return desired, reason
+        if desired < current_count and per_worker < self.target * (1 - self.scale_in_margin):
+            self.lower += 1
+            if self.lower >= self.down_streak:
+                self.lower = 0
+                return desired, reason
+        else:
+            self.lower = 0
+        return self.clamp(current_count), reason
+
+class PIDPolicy(ScalingPolicy):
+    """PID controller on queue depth around `target_depth`. The error is
+    expressed in workers (depth error / messages_per_worker); the output is
+    added to min_workers. The integral stops growing while the output is
+    saturated (anti-windup)."""
+    name = "pid"
+
+    def __init__(self, min_workers, max_workers, target_depth, messages_per_worker, kp=1.0, ki=0.05, kd=0.0):
+        super().__init__(min_workers, max_workers)
+        self.target_depth = target_depth
+        self.messages_per_worker = max(1, messages_per_worker)
+        self.kp, self.ki, self.kd = kp, ki, kd
+        self.integral = 0.0
+        self.last_error = None
+        self.last_time = None
+
+    def decide(self, observation):
+        now = observation["time"]
+        error = (observation["messages"] - self.target_depth) / self.messages_per_worker
+        dt = now - self.last_time if self.last_time is not None else 0.0
+        derivative = (error - self.last_error) / dt if dt > 0 and self.last_error is not None else 0.0
+
+        # Anti-windup: don't integrate further into an output that is already pinned at
+        # a bound in the error's direction. Judged on the rounded, clamped output: an
+        # unrounded check stops integrating just below min_workers and leaves enough
+        # integral behind to hold ceil() at min_workers + 1 for good.
+        held = self.output(error, derivative)
+        if not ((held >= self.max_workers and error > 0) or (held <= self.min_workers and error < 0)):
+            self.integral += error * dt
+        self.last_error = error
+        self.last_time = now
+        return self.output(error, derivative), f"error={error:.2f} integral={self.integral:.1f}"
+
+    def output(self, error, derivative):
+        return self.clamp(math.ceil(self.min_workers + self.kp * error + self.ki * self.integral
+                                    + self.kd * derivative))
+
+class PredictivePolicy(ScalingPolicy):
+    """Forecasts the backlog one worker startup ahead and sizes the pool to keep
+    up with arrivals while draining that backlog within `slo` seconds:
+
+        backlog(t + lead) = depth + (arrival_rate - n * worker_rate) * lead
+        desired           = ceil((arrival_rate + backlog(t + lead) / slo) / worker_rate)
+
+    Arrival rate is the windowed mean publish rate. Per-worker throughput comes
+    from the ack rate while workers are saturated, unless `worker_rate` is given.
+    Scale-downs need `down_streak` consecutive lower forecasts. Until there is
+    enough data the `fallback` policy decides."""
+    name = "predictive"
+
+    def __init__(self, min_workers, max_workers, window, lead_time, slo, worker_rate=0.0, min_samples=3,
+                 down_streak=3, fallback=None):
+        super().__init__(min_workers, max_workers)
+        self.window = window
+        self.lead_time = lead_time
+        self.slo = max(1.0, slo)
+        self.fixed_worker_rate = worker_rate
+        self.min_samples = min_samples
+        self.down_streak = down_streak
+        self.fallback = fallback
+        self.samples = deque()
+        self.worker_rate = worker_rate or None
+        self.lower = []  # recent lower recommendations, for scale-down hysteresis
+
+    def observe(self, sample):
+        self.samples.append(sample)
+        while self.samples and sample["time"] - self.samples[0]["time"] > self.window:
+            self.samples.popleft()
+        workers = sample["workers"]
+        # Throughput per worker is only meaningful while they all have work
+        if not self.fixed_worker_rate and workers > 0 and sample["messages"] > workers and sample["ack_rate"] > 0:
+            measured = sample["ack_rate"] / workers
+            self.worker_rate = measured if self.worker_rate is None else 0.7 * self.worker_rate + 0.3 * measured
+
+    def arrival_rate(self):
+        rate = sum(s["publish_rate"] for s in self.samples) / len(self.samples)
+        if rate == 0 and len(self.samples) >= 2:
+            # No publish stats (e.g. management rates disabled): infer from depth growth plus acks
+            first, last = self.samples[0], self.samples[-1]
+            elapsed = last["time"] - first["time"]
+            if elapsed > 0:
+                growth = (last["messages"] - first["messages"]) / elapsed
+                rate = max(0.0, growth + sum(s["ack_rate"] for s in self.samples) / len(self.samples))
+        return rate
+
+    def decide(self, observation):
+        self.observe(observation)
+        # The fallback sees every observation so its own state (streaks) stays current
+        fallback = self.fallback.decide(observation) if self.fallback else (None, "no fallback")
+        if len(self.samples) < self.min_samples:
+            return fallback[0], f"collecting samples ({len(self.samples)}/{self.min_samples}), {fallback[1]}"
+        if not self.worker_rate:
+            return fallback[0], f"per-worker throughput not measured yet, {fallback[1]}"
+
+        current_count = observation["workers"]
+        depth = self.samples[-1]["messages"]
+        arrival = self.arrival_rate()
+        backlog = max(0.0, depth + (arrival - current_count * self.worker_rate) * self.lead_time)
+        desired = self.clamp(math.ceil((arrival + backlog / self.slo) / self.worker_rate))
+
+        if desired < current_count:
+            self.lower.append(desired)
+            if len(self.lower) < self.down_streak:
+                desired = current_count
+            else:
+                desired = max(self.lower[-self.down_streak:])
+        else:
+            self.lower = []
+        return desired, (f"arrival={arrival:.2f}/s worker_rate={self.worker_rate:.2f}/s "
+                         f"backlog_in_{self.lead_time:.0f}s={backlog:.0f}")
+
+POLICY_NAMES = ("threshold", "target-tracking", "pid", "predictive")
+
+def build_policy(name, config):
+    """Build a policy from a flat config dict (autoscale.py passes its env settings)"""
+    min_workers, max_workers = config["min_workers"], config["max_workers"]
+    threshold = ThresholdPolicy(min_workers, max_workers, config["up_threshold"], config["down_threshold"],
+                                config["messages_per_worker"])
+    if name == "threshold":
+        return threshold
+    if name == "target-tracking":
+        return TargetTrackingPolicy(min_workers, max_workers, config["target_per_worker"])
+    if name == "pid":
+        return PIDPolicy(min_workers, max_workers, config["target_depth"], config["messages_per_worker"],
+                         config["pid_kp"], config["pid_ki"], config["pid_kd"])
+    if name == "predictive":
+        return PredictivePolicy(min_workers, max_workers, config["window"], config["lead_time"], config["slo"],
+                                config["worker_rate"], config["min_samples"], fallback=threshold)
+    raise ValueError(f"Unknown scaling policy '{name}', available: {', '.join(POLICY_NAMES)}")
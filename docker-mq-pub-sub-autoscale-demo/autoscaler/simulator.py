@@ -0,0 +1,338 @@
+"""Discrete-event simulator for the scaling policies in policies.py.
+
+Replays an arrival trace against a modelled worker pool and runs a policy on
+the autoscaler's poll loop, cooldown included. The model:
+
+- workers take `startup` seconds from `docker run` to consuming
+- each holds one message at a time (prefetch 1) for a fixed or exponential
+  service time
+- scale-down removes starting workers first, then idle ones, then busy ones,
+  which finish their current message first
+
+Reports drain time (last arrival to empty queue), peak backlog,
+container-seconds and message wait percentiles, without touching Docker:
+
+    python simulator.py --pattern burst --rate 0.5 --peak-rate 3 --duration 600
+    python simulator.py --trace samples.ndjson --policies predictive,pid
+    python simulator.py --pattern burst --check   # fails if a pool stays above --min
+
+A trace file holds either one arrival timestamp per line (seconds, any
+origin) or autoscaler samples as JSON lines with `time` and `publish_rate`,
+which are replayed as Poisson arrivals at the recorded rate.
+"""
+import argparse
+import heapq
+import json
+import math
+import random
+from collections import deque
+
+import policies
+
+# ========================
+# ARRIVAL TRACES
+# ========================
+def rate_function(pattern, rate, peak_rate, duration, burst_at=None, burst_seconds=60, period=300):
+    if pattern == "constant":
+        return lambda t: rate
+    if pattern == "step":
+        return lambda t: peak_rate if duration / 3 <= t < 2 * duration / 3 else rate
+    if pattern == "burst":
+        start = duration / 4 if burst_at is None else burst_at
+        return lambda t: peak_rate if start <= t < start + burst_seconds else rate
+    if pattern == "sine":
+        amplitude = (peak_rate - rate) / 2
+        return lambda t: max(0.0, rate + amplitude + amplitude * math.sin(2 * math.pi * t / period))
+    raise ValueError(f"Unknown pattern '{pattern}'")
+
+def poisson_arrivals(rate_at, start, end, max_rate, rng):
+    """Non-homogeneous Poisson arrivals by thinning"""
+    arrivals = []
+    if max_rate <= 0:
+        return arrivals
+    t = start
+    while True:
+        t += rng.expovariate(max_rate)
+        if t >= end:
+            return arrivals
+        if rng.random() * max_rate <= rate_at(t):
+            arrivals.append(t)
+
+def load_trace(path, rng, queue=None):
+    """Arrival times from a file of timestamps or of recorded autoscaler samples
+    (only those for `queue` when given; multi-queue logs tag each sample)"""
+    timestamps, samples = [], []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                sample = json.loads(line)
+                if queue is None or sample.get("queue") == queue:
+                    samples.append(sample)
+            else:
+                timestamps.append(float(line))
+    if samples:
+        samples.sort(key=lambda s: s["time"])
+        origin = samples[0]["time"]
+        arrivals = []
+        for current, following in zip(samples, samples[1:]):
+            rate = float(current.get("publish_rate", 0))
+            arrivals += poisson_arrivals(lambda t: rate, current["time"] - origin,
+                                         following["time"] - origin, rate, rng)
+        return arrivals
+    timestamps.sort()
+    return [t - timestamps[0] for t in timestamps] if timestamps else []
+
+# ========================
+# SIMULATION
+# ========================
+class Simulation:
+    def __init__(self, policy, arrivals, startup=10.0, service_time=5.0, service_dist="fixed", poll_interval=3.0,
+                 cooldown=30.0, initial_workers=None, horizon=1800.0, seed=0):
+        self.policy = policy
+        self.arrivals = sorted(arrivals)
+        self.startup = startup
+        self.service_time = service_time
+        self.service_dist = service_dist
+        self.poll_interval = poll_interval
+        self.cooldown = cooldown
+        self.initial_workers = policy.min_workers if initial_workers is None else initial_workers
+        self.horizon = horizon
+        self.rng = random.Random(seed)
+
+        self.events = []
+        self.seq = 0
+        self.queue = deque()  # arrival times of ready messages
+        self.workers = {}     # id -> {"state": starting|idle|busy, "started": t, "stopping": bool}
+        self.next_worker_id = 0
+        self.container_seconds = 0.0
+        self.waits = []
+        self.peak_backlog = 0
+        self.max_workers_seen = 0
+        self.scale_actions = 0
+        self.counts = {"arrived": 0, "delivered": 0, "acked": 0}
+        self.last_counts = dict(self.counts)
+        self.drained_at = None
+
+    def schedule(self, when, kind, payload=None):
+        heapq.heappush(self.events, (when, self.seq, kind, payload))
+        self.seq += 1
+
+    def draw_service_time(self):
+        if self.service_dist == "exp":
+            return self.rng.expovariate(1.0 / self.service_time)
+        return self.service_time
+
+    def active_workers(self):
+        return [wid for wid, w in self.workers.items() if not w["stopping"]]
+
+    def backlog(self):
+        return len(self.queue) + sum(1 for w in self.workers.values() if w["state"] == "busy")
+
+    def start_worker(self, now):
+        wid = self.next_worker_id
+        self.next_worker_id += 1
+        self.workers[wid] = {"state": "starting", "started": now, "stopping": False}
+        self.schedule(now + self.startup, "ready", wid)
+
+    def remove_worker(self, wid, now):
+        self.container_seconds += now - self.workers.pop(wid)["started"]
+
+    def dispatch(self, wid, now):
+        """Hand the next message to an idle worker"""
+        if not self.queue:
+            self.workers[wid]["state"] = "idle"
+            return
+        arrived = self.queue.popleft()
+        self.waits.append(now - arrived)
+        self.counts["delivered"] += 1
+        self.workers[wid]["state"] = "busy"
+        self.schedule(now + self.draw_service_time(), "done", wid)
+
+    def scale_to(self, desired, now):
+        active = self.active_workers()
+        if desired > len(active):
+            for _ in range(desired - len(active)):
+                self.start_worker(now)
+        else:
+            order = {"starting": 0, "idle": 1, "busy": 2}
+            victims = sorted(active, key=lambda wid: order[self.workers[wid]["state"]])[:len(active) - desired]
+            for wid in victims:
+                if self.workers[wid]["state"] == "busy":
+                    self.workers[wid]["stopping"] = True  # exits after its current message
+                else:
+                    self.remove_worker(wid, now)
+
+    def observe(self, now):
+        interval = self.poll_interval
+        rates = {key: (self.counts[key] - self.last_counts[key]) / interval for key in self.counts}
+        self.last_counts = dict(self.counts)
+        return {
+            "time": now,
+            "messages": self.backlog(),
+            "publish_rate": rates["arrived"],
+            "deliver_rate": rates["delivered"],
+            "ack_rate": rates["acked"],
+            "workers": len(self.active_workers()),
+        }
+
+    def run(self):
+        for t in self.arrivals:
+            self.schedule(t, "arrival")
+        for _ in range(self.initial_workers):
+            self.start_worker(0.0)
+        self.schedule(0.0, "poll")
+        end = (self.arrivals[-1] if self.arrivals else 0.0) + self.horizon
+        last_arrival = self.arrivals[-1] if self.arrivals else 0.0
+        last_scale = -math.inf
+        now = 0.0
+
+        while self.events:
+            now, _, kind, payload = heapq.heappop(self.events)
+            if now > end:
+                now = end
+                break
+            if kind == "arrival":
+                self.counts["arrived"] += 1
+                self.queue.append(now)
+                idle = next((wid for wid, w in self.workers.items() if w["state"] == "idle"), None)
+                if idle is not None:
+                    self.dispatch(idle, now)
+            elif kind == "ready":
+                if payload in self.workers:
+                    self.dispatch(payload, now)
+            elif kind == "done":
+                self.counts["acked"] += 1
+                if self.workers[payload]["stopping"]:
+                    self.remove_worker(payload, now)
+                else:
+                    self.dispatch(payload, now)
+            elif kind == "poll":
+                observation = self.observe(now)
+                desired, _ = self.policy.decide(observation)
+                if desired is not None and desired != observation["workers"] and now - last_scale >= self.cooldown:
+                    self.scale_to(desired, now)
+                    self.scale_actions += 1
+                    last_scale = now
+                self.max_workers_seen = max(self.max_workers_seen, len(self.active_workers()))
+                # Stop once everything is processed and the pool is back at its floor
+                drained = now >= last_arrival and self.backlog() == 0
+                if drained and len(self.active_workers()) <= self.policy.min_workers:
+                    break
+                self.schedule(now + self.poll_interval, "poll")
+
+            self.peak_backlog = max(self.peak_backlog, self.backlog())
+            if self.drained_at is None and now >= last_arrival and self.backlog() == 0 \
+                    and self.counts["arrived"] == len(self.arrivals):
+                self.drained_at = now
+
+        final_workers = len(self.active_workers())
+        for wid in list(self.workers):
+            self.remove_worker(wid, now)
+        return self.report(last_arrival, now, final_workers)
+
+    def report(self, last_arrival, finished, final_workers):
+        waits = sorted(self.waits)
+        percentile = lambda p: waits[min(len(waits) - 1, int(p * len(waits)))] if waits else 0.0
+        return {
+            "policy": self.policy.name,
+            "messages": len(self.arrivals),
+            "processed": self.counts["acked"],
+            "drain_seconds": round(self.drained_at - last_arrival, 1) if self.drained_at is not None else None,
+            "peak_backlog": self.peak_backlog,
+            "container_seconds": round(self.container_seconds, 1),
+            "max_workers": self.max_workers_seen,
+            "scale_actions": self.scale_actions,
+            "wait_p50": round(percentile(0.50), 2),
+            "wait_p99": round(percentile(0.99), 2),
+            "simulated_seconds": round(finished, 1),
+            "final_workers": final_workers,
+        }
+
+# ========================
+# CLI
+# ========================
+def main():
+    parser = argparse.ArgumentParser(description="Replay an arrival trace against scaling policies")
+    source = parser.add_argument_group("arrivals")
+    source.add_argument("--trace", help="file of arrival timestamps or recorded autoscaler samples (NDJSON)")
+    source.add_argument("--queue", help="with --trace: replay only this queue's samples from a multi-queue log")
+    source.add_argument("--pattern", default="burst", choices=["constant", "step", "burst", "sine"])
+    source.add_argument("--rate", type=float, default=0.5, help="base arrival rate, msgs/s")
+    source.add_argument("--peak-rate", type=float, default=3.0, help="peak arrival rate, msgs/s")
+    source.add_argument("--duration", type=float, default=600, help="seconds of synthetic arrivals")
+    source.add_argument("--burst-seconds", type=float, default=60)
+    source.add_argument("--period", type=float, default=300, help="sine period, seconds")
+
+    pool = parser.add_argument_group("worker pool")
+    pool.add_argument("--startup", type=float, default=10, help="seconds from start to consuming")
+    pool.add_argument("--service-time", type=float, default=5, help="mean seconds per message")
+    pool.add_argument("--service-dist", default="fixed", choices=["fixed", "exp"])
+    pool.add_argument("--poll", type=float, default=3, help="autoscaler POLL_INTERVAL")
+    pool.add_argument("--cooldown", type=float, default=30, help="autoscaler COOLDOWN_PERIOD")
+    pool.add_argument("--min", type=int, default=1, dest="min_workers")
+    pool.add_argument("--max", type=int, default=10, dest="max_workers")
+    pool.add_argument("--horizon", type=float, default=1800, help="max seconds simulated after the last arrival")
+
+    tuning = parser.add_argument_group("policies")
+    tuning.add_argument("--policies", default=",".join(policies.POLICY_NAMES))
+    tuning.add_argument("--up-threshold", type=int, default=2)
+    tuning.add_argument("--down-threshold", type=int, default=1)
+    tuning.add_argument("--messages-per-worker", type=int, default=1)
+    tuning.add_argument("--target-per-worker", type=float, default=2)
+    tuning.add_argument("--target-depth", type=float, default=1)
+    tuning.add_argument("--pid", default="1.0,0.05,0.0", help="kp,ki,kd")
+    tuning.add_argument("--window", type=float, default=60)
+    tuning.add_argument("--slo", type=float, default=30, help="predictive DRAIN_SLO_SECONDS")
+    tuning.add_argument("--worker-rate", type=float, default=0, help="predictive WORKER_SERVICE_RATE")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print one JSON report per policy")
+    parser.add_argument("--check", action="store_true",
+                        help="exit non-zero if a policy leaves the pool above --min once the queue has drained")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.trace:
+        arrivals = load_trace(args.trace, rng, args.queue)
+    else:
+        rate_at = rate_function(args.pattern, args.rate, args.peak_rate, args.duration,
+                                burst_seconds=args.burst_seconds, period=args.period)
+        arrivals = poisson_arrivals(rate_at, 0.0, args.duration, max(args.rate, args.peak_rate), rng)
+
+    kp, ki, kd = (float(x) for x in args.pid.split(","))
+    config = {
+        "min_workers": args.min_workers, "max_workers": args.max_workers,
+        "up_threshold": args.up_threshold, "down_threshold": args.down_threshold,
+        "messages_per_worker": args.messages_per_worker, "target_per_worker": args.target_per_worker,
+        "target_depth": args.target_depth, "pid_kp": kp, "pid_ki": ki, "pid_kd": kd,
+        "window": args.window, "lead_time": args.startup, "slo": args.slo,
+        "worker_rate": args.worker_rate, "min_samples": 3,
+    }
+
+    columns = ["policy", "drain_seconds", "peak_backlog", "container_seconds", "max_workers",
+               "scale_actions", "wait_p50", "wait_p99"]
+    if not args.json:
+        print(f"{len(arrivals)} arrivals; startup {args.startup}s, service {args.service_time}s ({args.service_dist}), "
+              f"poll {args.poll}s, cooldown {args.cooldown}s")
+        print("  ".join(f"{c:>17}" for c in columns))
+    stuck = []
+    for name in args.policies.split(","):
+        policy = policies.build_policy(name.strip(), config)
+        # Same seed per policy so every policy sees identical service times
+        result = Simulation(policy, arrivals, args.startup, args.service_time, args.service_dist, args.poll,
+                            args.cooldown, horizon=args.horizon, seed=args.seed).run()
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print("  ".join(f"{str(result[c]):>17}" for c in columns))
+        if result["final_workers"] > args.min_workers:
+            stuck.append(f"{result['policy']} ({result['final_workers']} workers)")
+
+    # Regression check: every policy must give the pool back once the burst is over
+    if args.check and stuck:
+        raise SystemExit(f"ERROR: still above --min {args.min_workers} after {args.horizon:g}s: {', '.join(stuck)}")
+
+if __name__ == "__main__":
+    main()
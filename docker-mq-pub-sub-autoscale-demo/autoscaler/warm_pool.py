@@ -0,0 +1,109 @@
+"""Warm standby workers for fast scale-up.
+
+Standby workers run with WARM_STANDBY=true: they start, connect to RabbitMQ
+and declare the queue, then idle (still answering heartbeats) without
+consuming. Activation renames the container to a regular worker name and
+sends SIGUSR1, after which the worker calls basic_consume; new capacity
+takes messages within tens of milliseconds instead of after a container
+start, interpreter start and AMQP handshake. Paused containers were not used
+because a frozen worker can't answer heartbeats and loses its connection.
+
+Standby containers are told apart by name ("<prefix>-standby-..."), so an
+autoscaler restart picks the existing pool back up from the inventory.
+"""
+import itertools
+import logging
+import threading
+import time
+
+import docker_backend
+
+logger = logging.getLogger("autoscaler")
+
+class WarmPool:
+    def __init__(self, docker, workers, name_prefix, size, ready_seconds, start_worker, executor, owns=None):
+        self.docker = docker
+        self.workers = workers  # WorkerInventory
+        self.owns = owns or (lambda container: True)  # pool membership when several pools share the inventory
+        self.name_prefix = name_prefix
+        self.standby_prefix = f"{name_prefix}-standby-"
+        self.size = size
+        self.ready_seconds = ready_seconds
+        self.start_worker = start_worker  # (name, extra_env) -> container id
+        self.executor = executor
+        self.lock = threading.Lock()
+        self.refilling = 0  # standby starts in flight
+        self.claimed = set()  # standby IDs being activated
+        self.activated = 0
+        self.activation_failures = 0
+        self.sequence = itertools.count()  # keeps names unique within the same second
+
+    def is_standby(self, container):
+        return container["name"].startswith(self.standby_prefix) and self.owns(container)
+
+    def standby(self):
+        with self.lock:
+            claimed = set(self.claimed)
+        return [c for c in self.workers.running() if self.is_standby(c) and c["id"] not in claimed]
+
+    def take(self, count):
+        """Activate up to `count` ready standby workers; returns their IDs"""
+        ready_before = time.time() - self.ready_seconds
+        with self.lock:
+            candidates = [c for c in self.workers.running()
+                          if self.is_standby(c) and c["id"] not in self.claimed and c["started"] <= ready_before]
+            candidates = candidates[:count]
+            self.claimed.update(c["id"] for c in candidates)
+        activated = []
+        stamp = int(time.time())
+        try:
+            for container in candidates:
+                name = f"{self.name_prefix}-{stamp}-w{next(self.sequence)}"
+                try:
+                    # Rename first: once signalled it consumes and must count as a worker
+                    self.docker.rename_container(container["id"], name)
+                    self.workers.rename(container["id"], name)
+                    self.docker.signal_container(container["id"], "SIGUSR1")
+                    activated.append(container["id"])
+                    logger.info(f"Activated warm standby {container['id']} as {name}")
+                except docker_backend.DockerError as e:
+                    self.activation_failures += 1
+                    logger.error(f"ERROR: Failed to activate standby {container['id']}: {e}")
+                    # Don't leave an idle container that may already carry a worker name
+                    try:
+                        self.docker.remove_container(container["id"], force=True)
+                        self.workers.remove(container["id"])
+                    except docker_backend.DockerError:
+                        pass
+        finally:
+            with self.lock:
+                self.claimed.difference_update(c["id"] for c in candidates)
+                self.activated += len(activated)
+        return activated
+
+    def refill(self):
+        """Start standby workers in the background until the pool is back to size"""
+        if self.size <= 0:
+            return
+        with self.lock:
+            standby = [c for c in self.workers.running() if self.is_standby(c) and c["id"] not in self.claimed]
+            missing = self.size - len(standby) - self.refilling
+            if missing <= 0:
+                return
+            self.refilling += missing
+        stamp = int(time.time())
+        for _ in range(missing):
+            self.executor.submit(self._start_standby, f"{self.standby_prefix}{stamp}-{next(self.sequence)}")
+
+    def _start_standby(self, name):
+        try:
+            self.start_worker(name, {"WARM_STANDBY": "true"})
+        except docker_backend.DockerError as e:
+            logger.error(f"ERROR: Failed to start standby worker {name}: {e}")
+        finally:
+            with self.lock:
+                self.refilling -= 1
+
+    def get_stats(self):
+        return {"size": self.size, "standby": len(self.standby()), "refilling": self.refilling,
+                "activated": self.activated, "activation_failures": self.activation_failures}
@@ -0,0 +1,329 @@
+import asyncio
+import itertools
+import os
+import time
+from datetime import datetime
+
+import aio_pika
+from aiohttp import web
+
+import message_codecs
+import tracing
+# Same message format, id sequence and tracer as the Flask publisher
+from common import CONTAINER_ID, logger, message_ids, parse_rabbitmq_port, prepare_message, tracer
+
+class AsyncRabbitMQPublisher:
+    """Asyncio counterpart of RabbitMQPublisher: one long-lived robust connection,
+    a fixed set of confirm-mode channels multiplexed over it, and non-blocking confirms.
+    Publishes are spread round-robin over the channels and never check one out:
+    any number of publishes can await their confirms on the same channel."""
+
+    def __init__(self):
+        self.rabbitmq_host = os.getenv('RABBITMQ_HOST', 'rabbitmq')
+        self.rabbitmq_port = parse_rabbitmq_port(os.getenv('RABBITMQ_PORT', '5672'))
+        self.rabbitmq_username = os.getenv('RABBITMQ_USERNAME', 'admin')
+        self.rabbitmq_password = os.getenv('RABBITMQ_PASSWORD', 'admin123')
+        self.queue_name = os.getenv('QUEUE_NAME', 'work_queue')
+
+        self.channel_count = max(1, int(os.getenv('ASYNC_CHANNEL_POOL_SIZE', '16')))
+        self.confirm_window = int(os.getenv('PUBLISH_CONFIRM_WINDOW', '0')) or 1000
+        self.confirm_timeout = float(os.getenv('PUBLISH_CONFIRM_TIMEOUT', '30'))
+
+        self.connection = None
+        self.channels = []
+        self.next_channel = itertools.count()
+        # Created in the running loop: on Python < 3.10 a lock built at import binds to
+        # the default loop, not the one web.run_app starts
+        self.connect_lock = None
+        self.message_count = 0
+
+        logger.info(f"Async publisher initialized - Host: {self.rabbitmq_host}, Port: {self.rabbitmq_port}, "
+                    f"Queue: {self.queue_name}, Channels: {self.channel_count}")
+
+    async def connect(self):
+        """Open the shared connection once; aio-pika reconnects it on failure"""
+        if self.connect_lock is None:
+            self.connect_lock = asyncio.Lock()
+        async with self.connect_lock:
+            if self.connection and not self.connection.is_closed:
+                return True
+            try:
+                logger.info(f"Connecting to RabbitMQ at {self.rabbitmq_host}:{self.rabbitmq_port}")
+                self.connection = await aio_pika.connect_robust(
+                    host=self.rabbitmq_host,
+                    port=self.rabbitmq_port,
+                    login=self.rabbitmq_username,
+                    password=self.rabbitmq_password,
+                    heartbeat=60
+                )
+                self.channels = [await self._open_channel() for _ in range(self.channel_count)]
+
+                # Declare queue
+                await self.channels[0].declare_queue(self.queue_name, durable=True)
+
+                logger.info("Successfully connected to RabbitMQ and declared queue")
+                return True
+            except Exception as e:
+                logger.error(f"ERROR: Failed to connect to RabbitMQ: {e}")
+                self.connection = None
+                self.channels = []
+                return False
+
+    async def _open_channel(self):
+        return await self.connection.channel(publisher_confirms=True)
+
+    async def _channel(self):
+        """Next shared channel, round-robin; one the broker closed is replaced"""
+        index = next(self.next_channel) % len(self.channels)
+        channel = self.channels[index]
+        if channel.is_closed:
+            channel = self.channels[index] = await self._open_channel()
+        return channel
+
+    async def close(self):
+        for channel in self.channels:
+            if not channel.is_closed:
+                await channel.close()
+        self.channels = []
+        if self.connection:
+            await self.connection.close()
+
+    async def _publish(self, message_data, content_type=None):
+        """Publish and wait for the broker confirm; raises on nack or timeout.
+        aio-pika resolves the publish with the confirm, so one span covers both."""
+        span = tracer.start_span('publish', kind=tracing.PRODUCER,
+                                 attributes={'messaging.destination.name': self.queue_name,
+                                             'messaging.publish.confirmed': True})
+        body, properties = prepare_message(message_data, next(message_ids), content_type, span)
+        try:
+            channel = await self._channel()
+            await channel.default_exchange.publish(
+                aio_pika.Message(body, **properties),
+                routing_key=self.queue_name,
+                timeout=self.confirm_timeout
+            )
+        except BaseException as e:
+            span.end(error=repr(e))
+            raise
+        span.end()
+        self.message_count += 1
+
+    async def publish_message(self, message_data, content_type=None):
+        """Publish a single message to RabbitMQ"""
+        if not await self.connect():
+            logger.error("Cannot establish connection to RabbitMQ")
+            return False
+        try:
+            await self._publish(message_data, content_type)
+            logger.info(f"Successfully published message {self.message_count}: {message_data}")
+            return True
+        except Exception as e:
+            logger.error(f"ERROR: Error publishing message: {e}")
+            return False
+
+    async def publish_batch(self, messages, delay_seconds=0.5, confirm_window=None, content_type=None):
+        """Publish multiple messages with up to `confirm_window` awaiting confirms"""
+        outcomes = ['error'] * len(messages)
+        if not await self.connect():
+            logger.error("Cannot establish connection to RabbitMQ")
+            return {'successful': 0, 'failed': len(messages), 'outcomes': outcomes}
+
+        window = asyncio.Semaphore(max(1, confirm_window or self.confirm_window))
+        started = time.time()
+
+        async def publish_one(index, message):
+            try:
+                await self._publish(message, content_type)
+                outcomes[index] = 'ack'
+            except aio_pika.exceptions.DeliveryError:
+                outcomes[index] = 'nack'
+            except asyncio.TimeoutError:
+                outcomes[index] = 'timeout'
+            except Exception as e:
+                logger.error(f"ERROR: Error publishing message {index}: {e}")
+            finally:
+                window.release()
+
+        tasks = []
+        for i, message in enumerate(messages):
+            await window.acquire()
+            tasks.append(asyncio.create_task(publish_one(i, message)))
+            if delay_seconds > 0 and i < len(messages) - 1:
+                await asyncio.sleep(delay_seconds)
+        await asyncio.gather(*tasks)
+
+        successful = outcomes.count('ack')
+        failed = len(outcomes) - successful
+        elapsed = time.time() - started
+        rate = successful / elapsed if elapsed > 0 else 0
+        logger.info(f"Batch complete: {successful} successful, {failed} failed ({rate:.0f} msgs/s)")
+        return {
+            'successful': successful,
+            'failed': failed,
+            'nacked': outcomes.count('nack'),
+            'timed_out': outcomes.count('timeout'),
+            'messages_per_second': round(rate, 1),
+            'outcomes': outcomes
+        }
+
+    async def get_queue_status(self):
+        """Get current queue statistics"""
+        if not await self.connect():
+            logger.error("Cannot connect to get queue status")
+            return None
+        try:
+            # A failed passive declare closes its channel, so keep it off the shared ones
+            channel = await self.connection.channel()
+            try:
+                queue = await channel.declare_queue(self.queue_name, passive=True)
+                return {
+                    'queue_name': self.queue_name,
+                    'message_count': queue.declaration_result.message_count,
+                    'consumer_count': queue.declaration_result.consumer_count
+                }
+            finally:
+                await channel.close()
+        except Exception as e:
+            logger.error(f"ERROR: Error getting queue status: {e}")
+            return None
+
+    async def test_connection(self):
+        """Test the connection and return status"""
+        try:
+            if await self.connect():
+                status = await self.get_queue_status()
+                if status:
+                    return True, f"Connection successful. Queue has {status['message_count']} messages."
+                else:
+                    return True, "Connection successful but couldn't get queue status."
+            else:
+                return False, "ERROR: Failed to connect to RabbitMQ"
+        except Exception as e:
+            return False, f"ERROR: Connection test failed: {e}"
+
+# aiohttp app
+publisher = AsyncRabbitMQPublisher()
+routes = web.RouteTableDef()
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except Exception:
+        return None
+
+@routes.get('/')
+async def health_check(request):
+    return web.json_response({
+        'status': 'healthy',
+        'service': 'rabbitmq-publisher-async',
+        'container_id': CONTAINER_ID,
+        'timestamp': datetime.utcnow().isoformat()
+    })
+
+@routes.get('/connection/test')
+async def test_connection(request):
+    try:
+        success, message = await publisher.test_connection()
+        return web.json_response({
+            'status': 'success' if success else 'error',
+            'message': message,
+            'container_id': CONTAINER_ID
+        }, status=200 if success else 500)
+    except Exception as e:
+        return web.json_response({'status': 'error', 'message': str(e), 'container_id': CONTAINER_ID}, status=500)
+
+@routes.post('/publish')
+async def publish_single_message(request):
+    try:
+        data = await read_json(request)
+        if not data:
+            return web.json_response({'error': 'No JSON data provided'}, status=400)
+
+        message = data.get('message', 'Default test message')
+        content_type = data.get('content_type')
+        if content_type and not message_codecs.is_supported(content_type):
+            return web.json_response({'error': f'Unsupported content_type {content_type}', 'container_id': CONTAINER_ID}, status=400)
+        logger.info(f"Received publish request: {message}")
+
+        if await publisher.publish_message(message, content_type):
+            return web.json_response({
+                'status': 'success',
+                'message': 'Message published successfully',
+                'data': message,
+                'container_id': CONTAINER_ID
+            })
+        else:
+            return web.json_response({
+                'status': 'error',
+                'message': 'Failed to publish message',
+                'container_id': CONTAINER_ID
+            }, status=500)
+
+    except Exception as e:
+        logger.error(f"ERROR: Error in publish endpoint: {e}")
+        return web.json_response({'error': str(e), 'container_id': CONTAINER_ID}, status=500)
+
+@routes.post('/publish/batch')
+async def publish_batch_messages(request):
+    try:
+        data = await read_json(request)
+        if not data:
+            return web.json_response({'error': 'No JSON data provided'}, status=400)
+
+        messages = data.get('messages', [])
+        count = data.get('count', len(messages))
+        delay = data.get('delay', 0.5)
+        confirm_window = data.get('confirm_window')
+        content_type = data.get('content_type')
+
+        if not messages and count > 0:
+            messages = [f"Test message {i+1}" for i in range(count)]
+
+        if not messages:
+            return web.json_response({'error': 'No messages to publish'}, status=400)
+
+        if content_type and not message_codecs.is_supported(content_type):
+            return web.json_response({'error': f'Unsupported content_type {content_type}', 'container_id': CONTAINER_ID}, status=400)
+
+        result = await publisher.publish_batch(messages, delay, confirm_window, content_type)
+
+        return web.json_response({
+            'status': 'completed',
+            'result': result,
+            'total_messages': len(messages),
+            'container_id': CONTAINER_ID
+        })
+
+    except Exception as e:
+        logger.error(f"ERROR: Error in batch publish: {e}")
+        return web.json_response({'error': str(e)}, status=500)
+
+@routes.get('/queue/status')
+async def get_queue_status(request):
+    try:
+        status = await publisher.get_queue_status()
+        if status:
+            status['container_id'] = CONTAINER_ID
+            return web.json_response(status)
+        else:
+            return web.json_response({'error': 'Unable to get queue status', 'container_id': CONTAINER_ID}, status=500)
+    except Exception as e:
+        return web.json_response({'error': str(e), 'container_id': CONTAINER_ID}, status=500)
+
+async def on_startup(app):
+    await publisher.connect()
+
+async def on_cleanup(app):
+    await publisher.close()
+
+def create_app():
+    app = web.Application()
+    app.add_routes(routes)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+if __name__ == '__main__':
+    port = int(os.getenv('PORT', 8080))
+    logger.info(f"Starting async publisher on port {port}")
+    web.run_app(create_app(), host='0.0.0.0', port=port, print=None)
@@ -1,220 +1,274 @@
-import pika
-import json
 import time
 import os
 import sys
 from datetime import datetime
 from flask import Flask, request, jsonify
 import threading
-import logging
-import re
-import socket
+import queue
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from contextlib import contextmanager
+from rate_limiter import RateLimiterConflict, RateLimiterRegistry
+import message_codecs
+from common import CONTAINER_ID, MESSAGE_COMPRESSION, MESSAGE_COMPRESSION_THRESHOLD, logger, tracer
+from rabbitmq_publisher import RabbitMQPublisher, iter_ndjson
 
-def get_container_id():
-    """Get the container ID from various sources"""
-    try:
-        # Method 1: Read from cgroup (most reliable)
-        with open('/proc/self/cgroup', 'r') as f:
-            for line in f:
-                if 'docker' in line:
-                    container_id = line.strip().split('/')[-1]
-                    if len(container_id) == 64:  # Full Docker ID
-                        return container_id[:12]  # Return short ID
-        
-        # Method 2: Hostname (Docker sets this to container ID by default)
-        hostname = socket.gethostname()
-        if len(hostname) == 12:  # Short container ID
-            return hostname
-            
-        # Method 3: Check if hostname looks like container ID
-        if len(hostname) > 8 and hostname.replace('-', '').replace('_', '').isalnum():
-            return hostname[:12]
-            
-    except Exception as e:
-        pass
+class PublisherPool:
+    """Bounded pool of publisher connections. pika connections are not
+    thread-safe, so each request thread checks out its own publisher."""
     
-    # Fallback: Use hostname or unknown
-    return socket.gethostname()[:12] or "unknown"
-
-CONTAINER_ID = get_container_id()
-
-# Configure logging
-logging.basicConfig(level=logging.INFO, format=f'%(asctime)s - %(levelname)s - [{CONTAINER_ID}] - %(message)s')
-logger = logging.getLogger(__name__)
-
-class RabbitMQPublisher:
-    def __init__(self):
-        # Handle Kubernetes environment variables properly
-        self.rabbitmq_host = os.getenv('RABBITMQ_HOST', 'rabbitmq')
-        
-        # Parse port from potentially complex format
-        rabbitmq_port_env = os.getenv('RABBITMQ_PORT', '5672')
-        if rabbitmq_port_env.startswith('tcp://'):
-            # Extract port from tcp://host:port format
-            port_match = re.search(r':(\d+)$', rabbitmq_port_env)
-            self.rabbitmq_port = int(port_match.group(1)) if port_match else 5672
-        else:
-            try:
-                self.rabbitmq_port = int(rabbitmq_port_env)
-            except ValueError:
-                logger.warning(f"ERROR: Could not parse port from {rabbitmq_port_env}, using default 5672")
-                self.rabbitmq_port = 5672
+    def __init__(self, size, checkout_timeout=30.0, liveness_interval=15.0):
+        self.size = max(1, size)
+        self.checkout_timeout = checkout_timeout
+        self.liveness_interval = liveness_interval
+        self.idle = queue.LifoQueue()  # most recently used first, keeps warm connections hot
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.publishers = []
+        self.in_use = 0
         
-        self.rabbitmq_username = os.getenv('RABBITMQ_USERNAME', 'admin')
-        self.rabbitmq_password = os.getenv('RABBITMQ_PASSWORD', 'admin123')
-        self.queue_name = os.getenv('QUEUE_NAME', 'work_queue')
+        # Gauges
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+        self.liveness_checks = 0
+        self.dead_connections = 0
         
-        self.connection = None
-        self.channel = None
-        self.message_count = 0
+        # Background liveness tracker keeps idle connections' heartbeats flowing
+        self.monitor_thread = threading.Thread(target=self._monitor_loop, name='pool-liveness', daemon=True)
+        self.monitor_thread.start()
         
-        logger.info(f"Publisher initialized - Host: {self.rabbitmq_host}, Port: {self.rabbitmq_port}, Queue: {self.queue_name}")
-        logger.info(f"Raw RABBITMQ_PORT env: {rabbitmq_port_env}")
+        logger.info(f"Publisher pool initialized - size: {self.size}")
+    
+    def _monitor_loop(self):
+        while True:
+            time.sleep(self.liveness_interval)
+            try:
+                self.check_idle_connections()
+            except Exception as e:
+                logger.error(f"ERROR: Liveness check failed: {e}")
+    
+    def check_idle_connections(self):
+        """Service heartbeats on connections that are idle in the pool. Only
+        checked-in publishers are touched, so no connection is shared across threads."""
+        borrowed = []
+        try:
+            while True:
+                borrowed.append(self.idle.get_nowait())
+        except queue.Empty:
+            pass
         
-    def connect(self):
-        """Connect to RabbitMQ"""
+        now = time.monotonic()
         try:
-            if self.connection and not self.connection.is_closed:
-                return True
-                
-            logger.info(f"Connecting to RabbitMQ at {self.rabbitmq_host}:{self.rabbitmq_port}")
-            
-            credentials = pika.PlainCredentials(self.rabbitmq_username, self.rabbitmq_password)
-            parameters = pika.ConnectionParameters(
-                host=self.rabbitmq_host,
-                port=self.rabbitmq_port,
-                credentials=credentials,
-                connection_attempts=3,
-                retry_delay=2,
-                socket_timeout=10,
-                heartbeat=600,
-                blocked_connection_timeout=300
-            )
-            
-            self.connection = pika.BlockingConnection(parameters)
-            self.channel = self.connection.channel()
-            
-            # Declare queue
-            self.channel.queue_declare(queue=self.queue_name, durable=True)
-            
-            logger.info("Successfully connected to RabbitMQ and declared queue")
-            return True
-            
-        except Exception as e:
-            logger.error(f"ERROR: Failed to connect to RabbitMQ: {e}")
-            self.connection = None
-            self.channel = None
-            return False
+            for publisher in borrowed:
+                if now - publisher.last_activity < self.liveness_interval:
+                    continue
+                self.liveness_checks += 1
+                if not publisher.service_heartbeat():
+                    self.dead_connections += 1
+        finally:
+            # Put them back oldest first so the LIFO order is preserved
+            for publisher in reversed(borrowed):
+                self.idle.put(publisher)
     
-    def ensure_connection(self):
-        """Ensure we have a working connection"""
+    def _acquire(self):
         try:
-            if self.connection is None or self.connection.is_closed:
-                return self.connect()
-            
-            # Test the connection
-            self.connection.process_data_events(time_limit=0)
-            return True
-            
-        except Exception as e:
-            logger.warning(f"ERROR: Connection test failed, reconnecting: {e}")
-            return self.connect()
-    
-    def publish_message(self, message_data):
-        """Publish a single message to RabbitMQ"""
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        
+        # Create connections lazily, up to the pool size
+        with self.lock:
+            if len(self.publishers) < self.size:
+                publisher = RabbitMQPublisher()
+                self.publishers.append(publisher)
+                return publisher
+        
         try:
-            # Ensure we have a working connection
-            if not self.ensure_connection():
-                logger.error("Cannot establish connection to RabbitMQ")
-                return False
-            
-            # Create the message
-            enhanced_message = {
-                'id': self.message_count,
-                'data': message_data,
-                'timestamp': datetime.utcnow().isoformat(),
-                'source': 'publisher',
-                'publisher_container_id': CONTAINER_ID
-            }
-            
-            # Publish the message
-            self.channel.basic_publish(
-                exchange='',
-                routing_key=self.queue_name,
-                body=json.dumps(enhanced_message),
-                properties=pika.BasicProperties(
-                    delivery_mode=2,  # Persistent message
-                    content_type='application/json'
-                )
-            )
-            
-            self.message_count += 1
-            logger.info(f"Successfully published message {self.message_count}: {message_data}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"ERROR: Error publishing message: {e}")
-            # Reset connection on error
-            try:
-                if self.connection:
-                    self.connection.close()
-            except:
-                pass
-            self.connection = None
-            self.channel = None
-            return False
+            return self.idle.get(timeout=self.checkout_timeout)
+        except queue.Empty:
+            with self.lock:
+                self.checkout_timeouts += 1
+            raise TimeoutError(f"No publisher connection available within {self.checkout_timeout}s")
     
-    def get_queue_status(self):
-        """Get current queue statistics"""
+    def _health_check(self, publisher):
+        """Drop dead connections on borrow; the publisher reconnects lazily on use"""
+        connection_dead = publisher.connection is not None and publisher.connection.is_closed
+        channel_dead = publisher.channel is not None and publisher.channel.is_closed
+        if connection_dead or channel_dead:
+            logger.warning("Pooled connection is closed, it will reconnect on next use")
+            publisher.reset_connection()
+    
+    @contextmanager
+    def checkout(self):
+        """Borrow a publisher for the current thread (re-entrant within a thread)"""
+        held = getattr(self.local, 'publisher', None)
+        if held is not None:
+            yield held
+            return
+        
+        started = time.monotonic()
+        publisher = self._acquire()
+        waited = time.monotonic() - started
+        with self.lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.total_wait += waited
+            self.last_wait = waited
+            self.max_wait = max(self.max_wait, waited)
+        
+        self._health_check(publisher)
+        self.local.publisher = publisher
         try:
-            if not self.ensure_connection():
-                logger.error("Cannot connect to get queue status")
-                return None
-            
-            method = self.channel.queue_declare(queue=self.queue_name, durable=True, passive=True)
+            yield publisher
+        finally:
+            self.local.publisher = None
+            with self.lock:
+                self.in_use -= 1
+            self.idle.put(publisher)
+    
+    def get_stats(self):
+        """Pool size, utilization and checkout wait gauges"""
+        with self.lock:
             return {
-                'queue_name': self.queue_name,
-                'message_count': method.method.message_count,
-                'consumer_count': method.method.consumer_count
+                'pool_size': self.size,
+                'connections_created': len(self.publishers),
+                'in_use': self.in_use,
+                'idle': self.idle.qsize(),
+                'utilization': round(self.in_use / self.size, 3),
+                'checkouts': self.checkouts,
+                'checkout_timeouts': self.checkout_timeouts,
+                'wait_ms_last': round(self.last_wait * 1000, 3),
+                'wait_ms_avg': round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                'wait_ms_max': round(self.max_wait * 1000, 3),
+                'liveness_checks': self.liveness_checks,
+                'dead_connections_detected': self.dead_connections,
+                'reconnects': sum(p.reconnects for p in self.publishers),
+                'messages_published': sum(p.message_count for p in self.publishers)
             }
-        except Exception as e:
-            logger.error(f"ERROR: Error getting queue status: {e}")
-            return None
+
+class PublishJob:
+    """A batch published in the background, with progress for polling"""
     
-    def publish_batch(self, messages, delay_seconds=0.5):
-        """Publish multiple messages"""
-        successful = 0
-        failed = 0
-        
-        for i, message in enumerate(messages):
-            if self.publish_message(message):
-                successful += 1
-            else:
-                failed += 1
-            
-            if delay_seconds > 0 and i < len(messages) - 1:
-                time.sleep(delay_seconds)
-        
-        logger.info(f"Batch complete: {successful} successful, {failed} failed")
-        return {'successful': successful, 'failed': failed}
+    def __init__(self, messages, delay_seconds, confirm_window, rate_limiter=None, content_type=None):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.messages = messages
+        self.delay_seconds = delay_seconds
+        self.confirm_window = confirm_window
+        self.rate_limiter = rate_limiter
+        self.content_type = content_type
+        self.total = len(messages)
+        self.state = 'queued'
+        self.sent = 0
+        self.successful = 0
+        self.failed = 0
+        self.error = None
+        self.submitted_at = datetime.utcnow()
+        self.started = None
+        self.finished = None
+    
+    def update(self, sent, successful, failed):
+        self.sent = sent
+        self.successful = successful
+        self.failed = failed
+    
+    @property
+    def done(self):
+        return self.state in ('completed', 'failed')
     
-    def test_connection(self):
-        """Test the connection and return status"""
+    def to_dict(self):
+        elapsed = 0.0
+        if self.started:
+            elapsed = (self.finished or time.monotonic()) - self.started
+        return {
+            'job_id': self.job_id,
+            'state': self.state,
+            'total_messages': self.total,
+            'sent': self.sent,
+            'successful': self.successful,
+            'failed': self.failed,
+            'progress': round(self.sent / self.total, 4) if self.total else 1.0,
+            'messages_per_second': round(self.successful / elapsed, 1) if elapsed > 0 else 0.0,
+            'elapsed_seconds': round(elapsed, 3),
+            'submitted_at': self.submitted_at.isoformat(),
+            'rate_limiter': self.rate_limiter.name if self.rate_limiter else None,
+            'error': self.error
+        }
+
+class PublishJobRegistry:
+    """Runs batch jobs on a small executor and keeps a bounded history;
+    the oldest finished jobs are evicted first."""
+    
+    def __init__(self, pool, max_workers, max_jobs):
+        self.pool = pool
+        self.max_jobs = max(1, max_jobs)
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='publish-job')
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        logger.info(f"Publish job registry initialized - workers: {max_workers}, history: {self.max_jobs}")
+    
+    def _evict(self):
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.done]:
+            if len(self.jobs) < self.max_jobs:
+                break
+            del self.jobs[job_id]
+    
+    def submit(self, messages, delay_seconds, confirm_window, rate_limiter=None, content_type=None):
+        """Queue a batch; returns None when the registry is full of unfinished jobs"""
+        job = PublishJob(messages, delay_seconds, confirm_window, rate_limiter, content_type)
+        with self.lock:
+            self._evict()
+            if len(self.jobs) >= self.max_jobs:
+                return None
+            self.jobs[job.job_id] = job
+        self.executor.submit(self._run, job)
+        logger.info(f"Job {job.job_id} queued with {job.total} messages")
+        return job
+    
+    def _run(self, job):
+        job.state = 'running'
+        job.started = time.monotonic()
         try:
-            if self.connect():
-                status = self.get_queue_status()
-                if status:
-                    return True, f"Connection successful. Queue has {status['message_count']} messages."
-                else:
-                    return True, "Connection successful but couldn't get queue status."
-            else:
-                return False, "ERROR: Failed to connect to RabbitMQ"
+            with self.pool.checkout() as publisher:
+                result = publisher.publish_batch(job.messages, job.delay_seconds, job.confirm_window,
+                                                 job.update, job.rate_limiter, job.content_type)
+            job.update(job.total, result['successful'], result['failed'])
+            job.state = 'completed'
         except Exception as e:
-            return False, f"ERROR: Connection test failed: {e}"
+            logger.error(f"ERROR: Job {job.job_id} failed: {e}")
+            job.error = str(e)
+            job.state = 'failed'
+        finally:
+            job.finished = time.monotonic()
+            job.messages = None  # release the payloads, keep only the counters
+        logger.info(f"Job {job.job_id} {job.state}: {job.successful} successful, {job.failed} failed")
+    
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+    
+    def list(self):
+        with self.lock:
+            return [job.to_dict() for job in self.jobs.values()]
 
 # Flask app
 app = Flask(__name__)
-publisher = RabbitMQPublisher()
+publisher_pool = PublisherPool(
+    size=int(os.getenv('PUBLISHER_POOL_SIZE', '8')),
+    checkout_timeout=float(os.getenv('PUBLISHER_POOL_TIMEOUT', '30')),
+    liveness_interval=float(os.getenv('RABBITMQ_HEARTBEAT', '60')) / 4
+)
+# Token buckets shared by every batch/job that names them
+rate_limiters = RateLimiterRegistry()
+# Job workers each hold a pooled connection while they run, so keep this below the pool size
+publish_jobs = PublishJobRegistry(
+    publisher_pool,
+    max_workers=int(os.getenv('PUBLISH_JOB_WORKERS', '2')),
+    max_jobs=int(os.getenv('PUBLISH_JOB_HISTORY', '100'))
+)
 
 @app.route('/', methods=['GET'])
 def health_check():
@@ -235,14 +289,15 @@ def debug_env():
         'RABBITMQ_USERNAME': os.getenv('RABBITMQ_USERNAME'),
         'RABBITMQ_PASSWORD': os.getenv('RABBITMQ_PASSWORD')[:3] + '***' if os.getenv('RABBITMQ_PASSWORD') else None,
         'QUEUE_NAME': os.getenv('QUEUE_NAME'),
-        'parsed_port': publisher.rabbitmq_port,
+        'parsed_port': publisher_pool.publishers[0].rabbitmq_port if publisher_pool.publishers else None,
         'all_rabbitmq_vars': {k: v for k, v in os.environ.items() if 'RABBIT' in k.upper()}
     })
 
 @app.route('/connection/test', methods=['GET'])
 def test_connection():
     try:
-        success, message = publisher.test_connection()
+        with publisher_pool.checkout() as publisher:
+            success, message = publisher.test_connection()
         return jsonify({
             'status': 'success' if success else 'error',
             'message': message,
@@ -259,9 +314,13 @@ def publish_single_message():
             return jsonify({'error': 'No JSON data provided'}), 400
         
         message = data.get('message', 'Default test message')
+        content_type = data.get('content_type')
+        if content_type and not message_codecs.is_supported(content_type):
+            return jsonify({'error': f'Unsupported content_type {content_type}', 'container_id': CONTAINER_ID}), 400
         logger.info(f"Received publish request: {message}")
         
-        success = publisher.publish_message(message)
+        with publisher_pool.checkout() as publisher:
+            success = publisher.publish_message(message, content_type)
         
         if success:
             return jsonify({
@@ -291,6 +350,8 @@ def publish_batch_messages():
         messages = data.get('messages', [])
         count = data.get('count', len(messages))
         delay = data.get('delay', 0.5)
+        confirm_window = data.get('confirm_window')
+        content_type = data.get('content_type')
         
         if not messages and count > 0:
             messages = [f"Test message {i+1}" for i in range(count)]
@@ -298,7 +359,36 @@ def publish_batch_messages():
         if not messages:
             return jsonify({'error': 'No messages to publish'}), 400
         
-        result = publisher.publish_batch(messages, delay)
+        if content_type and not message_codecs.is_supported(content_type):
+            return jsonify({'error': f'Unsupported content_type {content_type}', 'container_id': CONTAINER_ID}), 400
+        
+        # bool is an int subclass, hence type() rather than isinstance()
+        if confirm_window is not None and (type(confirm_window) is not int or confirm_window < 0):
+            return jsonify({'error': f'Invalid confirm_window {confirm_window!r}, expected a non-negative integer', 'container_id': CONTAINER_ID}), 400
+        
+        try:
+            rate_limiter = rate_limiters.resolve(data.get('rate'))
+        except RateLimiterConflict as e:
+            return jsonify({'error': str(e), 'container_id': CONTAINER_ID}), 409
+        except (ValueError, TypeError, AttributeError) as e:
+            return jsonify({'error': f'Invalid rate: {e}', 'container_id': CONTAINER_ID}), 400
+        
+        if data.get('async'):
+            # Job mode: return immediately and let the background executor publish
+            job = publish_jobs.submit(messages, delay, confirm_window, rate_limiter, content_type)
+            if job is None:
+                return jsonify({'error': 'Too many unfinished jobs, try again later', 'container_id': CONTAINER_ID}), 429
+            return jsonify({
+                'status': 'accepted',
+                'job_id': job.job_id,
+                'status_url': f"/publish/jobs/{job.job_id}",
+                'total_messages': job.total,
+                'container_id': CONTAINER_ID
+            }), 202
+        
+        with publisher_pool.checkout() as publisher:
+            result = publisher.publish_batch(messages, delay, confirm_window, rate_limiter=rate_limiter,
+                                             content_type=content_type)
         
         return jsonify({
             'status': 'completed',
@@ -311,10 +401,72 @@ def publish_batch_messages():
         logger.error(f"ERROR: Error in batch publish: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/publish/jobs', methods=['GET'])
+def list_publish_jobs():
+    """Recent background batch jobs, oldest first"""
+    return jsonify({'jobs': publish_jobs.list(), 'container_id': CONTAINER_ID})
+
+@app.route('/publish/jobs/<job_id>', methods=['GET'])
+def get_publish_job(job_id):
+    """Progress, rate and failures of a background batch job"""
+    job = publish_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown job {job_id}', 'container_id': CONTAINER_ID}), 404
+    status = job.to_dict()
+    status['container_id'] = CONTAINER_ID
+    return jsonify(status)
+
+@app.route('/rate-limiters', methods=['GET'])
+def list_rate_limiters():
+    """Configured token buckets with their current target and achieved rates"""
+    return jsonify({'rate_limiters': rate_limiters.get_stats(), 'container_id': CONTAINER_ID})
+
+@app.route('/rate-limiters/<name>', methods=['PUT'])
+def configure_rate_limiter(name):
+    """Create or retune a named limiter; running jobs using it pick up the change"""
+    data = request.get_json()
+    if not data:
+        return jsonify({'error': 'No JSON data provided'}), 400
+    try:
+        data['limiter'] = name
+        limiter = rate_limiters.configure(data)
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': f'Invalid rate: {e}', 'container_id': CONTAINER_ID}), 400
+    stats = limiter.get_stats()
+    stats['container_id'] = CONTAINER_ID
+    return jsonify(stats)
+
+@app.route('/publish/stream', methods=['POST'])
+def publish_stream_messages():
+    """Bulk ingest: one JSON value per line (NDJSON), chunked transfer encoding welcome"""
+    try:
+        confirm_window = request.args.get('confirm_window', type=int)
+        content_type = request.args.get('content_type')
+        if content_type and not message_codecs.is_supported(content_type):
+            return jsonify({'error': f'Unsupported content_type {content_type}', 'container_id': CONTAINER_ID}), 400
+        records = iter_ndjson(request.stream)
+        
+        with publisher_pool.checkout() as publisher:
+            result = publisher.publish_stream(records, confirm_window, content_type)
+        
+        if result is None:
+            return jsonify({'error': 'Cannot establish connection to RabbitMQ', 'container_id': CONTAINER_ID}), 500
+        
+        return jsonify({
+            'status': 'completed' if 'error' not in result else 'aborted',
+            'result': result,
+            'container_id': CONTAINER_ID
+        }), 200 if 'error' not in result else 500
+        
+    except Exception as e:
+        logger.error(f"ERROR: Error in stream publish: {e}")
+        return jsonify({'error': str(e), 'container_id': CONTAINER_ID}), 500
+
 @app.route('/queue/status', methods=['GET'])
 def get_queue_status():
     try:
-        status = publisher.get_queue_status()
+        with publisher_pool.checkout() as publisher:
+            status = publisher.get_queue_status()
         if status:
             status['container_id'] = CONTAINER_ID
             return jsonify(status)
@@ -323,7 +475,34 @@ def get_queue_status():
     except Exception as e:
         return jsonify({'error': str(e), 'container_id': CONTAINER_ID}), 500
 
+@app.route('/stats/compression', methods=['GET'])
+def get_compression_stats():
+    """Compression ratio and CPU cost for bodies published by this process"""
+    stats = message_codecs.compression_stats.to_dict()
+    stats.update({
+        'compression': MESSAGE_COMPRESSION,
+        'threshold_bytes': MESSAGE_COMPRESSION_THRESHOLD,
+        'available': sorted(message_codecs.COMPRESSORS),
+        'container_id': CONTAINER_ID
+    })
+    return jsonify(stats)
+
+@app.route('/stats/tracing', methods=['GET'])
+def get_tracing_stats():
+    """Span export counters for this process"""
+    stats = tracer.get_stats()
+    stats['container_id'] = CONTAINER_ID
+    return jsonify(stats)
+
+@app.route('/pool/stats', methods=['GET'])
+def get_pool_stats():
+    """Connection pool size, utilization and checkout wait time"""
+    stats = publisher_pool.get_stats()
+    stats['container_id'] = CONTAINER_ID
+    return jsonify(stats)
+
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 8080))
     logger.info(f"Starting publisher on port {port}")
-    app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
+    # One request thread per in-flight call; each checks out its own pooled connection
+    app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
\ No newline at end of file
@@ -0,0 +1,88 @@
+"""Batch handlers: decode a batch of messages into columns once, then run the
+transform over whole NumPy arrays instead of one message at a time.
+
+A handler declares the columns it needs, `extract()` pulls those fields out of
+one decoded message, and `transform()` gets the filled arrays. Rows whose
+fields are missing or not numeric are masked out rather than failing the batch.
+"""
+import math
+
+import numpy as np
+
+class BatchHandler:
+    # column name -> dtype
+    columns = {}
+
+    def extract(self, message):
+        """Return a tuple of column values for one decoded message, or None to skip it"""
+        raise NotImplementedError
+
+    def transform(self, columns, valid):
+        """Vectorized work over the batch; returns a summary dict for logging"""
+        raise NotImplementedError
+
+    def to_columns(self, messages):
+        """Single pass over the batch filling preallocated arrays"""
+        size = len(messages)
+        arrays = {name: np.zeros(size, dtype=dtype) for name, dtype in self.columns.items()}
+        names = list(self.columns)
+        valid = np.zeros(size, dtype=bool)
+        for row, message in enumerate(messages):
+            try:
+                values = self.extract(message)
+            except (TypeError, ValueError, KeyError):
+                values = None
+            if values is None:
+                continue
+            for name, value in zip(names, values):
+                arrays[name][row] = value
+            valid[row] = True
+        return arrays, valid
+
+    def handle(self, messages):
+        columns, valid = self.to_columns(messages)
+        summary = self.transform(columns, valid)
+        summary['skipped'] = int(len(messages) - valid.sum())
+        return summary
+
+class NormalizeHandler(BatchHandler):
+    """Reference transform: log-scale and z-normalize the numeric `data` field
+    (a number, or a dict with a `value` key) across the batch"""
+    columns = {'id': np.int64, 'value': np.float64}
+
+    def extract(self, message):
+        if not isinstance(message, dict):
+            return None
+        data = message.get('data')
+        if isinstance(data, dict):
+            data = data.get('value')
+        if isinstance(data, bool) or data is None:
+            return None
+        value = float(data)
+        if not math.isfinite(value):
+            return None
+        return int(message.get('id', -1)), value
+
+    def transform(self, columns, valid):
+        values = columns['value'][valid]
+        if not values.size:
+            return {'rows': 0}
+        scaled = np.sign(values) * np.log1p(np.abs(values))
+        std = scaled.std()
+        normalized = (scaled - scaled.mean()) / std if std > 0 else np.zeros_like(scaled)
+        return {
+            'rows': int(values.size),
+            'mean': round(float(values.mean()), 6),
+            'min': round(float(values.min()), 6),
+            'max': round(float(values.max()), 6),
+            'max_abs_z': round(float(np.abs(normalized).max()), 6)
+        }
+
+HANDLERS = {
+    'normalize': NormalizeHandler
+}
+
+def get_handler(name):
+    if name not in HANDLERS:
+        raise ValueError(f"Unknown batch handler '{name}', available: {sorted(HANDLERS)}")
+    return HANDLERS[name]()
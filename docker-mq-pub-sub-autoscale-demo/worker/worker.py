@@ -1,9 +1,31 @@
 import pika
+import os
 import time
 import signal
 import sys
 import logging
 import socket
+import json
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import message_codecs
+import tracing
+import batch_handlers
+from prefetch_controller import PrefetchController
+
+# Warm standby (WARM_STANDBY=true, set by the autoscaler's warm pool): connect and
+# declare the queue, then idle until SIGUSR1 before consuming. The handler is set
+# before connecting so an early activation signal can't kill the process.
+WARM_STANDBY = os.getenv("WARM_STANDBY", "false").lower() == "true"
+activation_requested_at = None
+
+def activation_handler(sig, frame):
+    global activation_requested_at
+    if activation_requested_at is None:
+        activation_requested_at = time.monotonic()
+
+signal.signal(signal.SIGUSR1, activation_handler)
 
 def get_container_id():
     """Get the container ID from various sources"""
@@ -44,8 +66,28 @@ logging.basicConfig(level=logging.INFO, format=f'%(asctime)s - %(levelname)s - [
 
 logger = logging.getLogger(__name__)
 
-RABBITMQ_HOST = "rabbitmq"   # service name from docker-compose
-QUEUE_NAME = "my-queue"
+# Continues the publisher's trace (traceparent header) with dequeue, process and ack spans
+tracer = tracing.Tracer.from_env("worker")
+
+RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "rabbitmq")   # service name from docker-compose
+QUEUE_NAME = os.getenv("QUEUE_NAME", "my-queue")  # set per pool by the autoscaler
+COMPRESSION_LOG_EVERY = 100  # log decompression ratio/CPU every N messages
+
+# Batch mode (BATCH_SIZE > 1): up to BATCH_SIZE messages, or whatever arrived
+# within BATCH_LINGER_MS of the first one, go through a vectorized batch handler
+BATCH_SIZE = max(1, int(os.getenv("BATCH_SIZE", "1")))
+BATCH_LINGER_MS = float(os.getenv("BATCH_LINGER_MS", "100"))
+BATCH_HANDLER = os.getenv("BATCH_HANDLER", "normalize")
+batch_handler = batch_handlers.get_handler(BATCH_HANDLER) if BATCH_SIZE > 1 else None
+
+# Adaptive prefetch: retune basic_qos from measured processing time and RTT
+ADAPTIVE_PREFETCH = os.getenv("ADAPTIVE_PREFETCH", "false").lower() == "true"
+prefetch = PrefetchController(
+    concurrency=BATCH_SIZE,
+    min_prefetch=int(os.getenv("PREFETCH_MIN", str(BATCH_SIZE))),
+    max_prefetch=int(os.getenv("PREFETCH_MAX", str(max(BATCH_SIZE, 50)))),
+    adjust_interval=float(os.getenv("PREFETCH_ADJUST_INTERVAL", "5"))
+)
 
 print(f"[{CONTAINER_ID}] Worker starting up...", flush=True)
 logger.info(f"Worker {WORKER_NAME} initializing - Host: {RABBITMQ_HOST}, Queue: {QUEUE_NAME}")
@@ -76,22 +118,224 @@ def shutdown_handler(sig, frame):
 signal.signal(signal.SIGTERM, shutdown_handler)
 signal.signal(signal.SIGINT, shutdown_handler)
 
+# Status channel for the autoscaler (WORKER_STATUS_PORT, 0 disables):
+#   GET  /status  state (standby/idle/busy/draining), in-flight messages, idle time
+#   POST /drain   stop consuming, settle in-flight work, close and exit
+WORKER_STATUS_PORT = int(os.getenv("WORKER_STATUS_PORT", "8081"))
+draining = False
+
+def worker_status():
+    in_flight = prefetch.active
+    if draining:
+        state = "draining"
+    elif WARM_STANDBY and activation_requested_at is None:
+        state = "standby"
+    else:
+        state = "busy" if in_flight else "idle"
+    idle_since = prefetch.idle_since if prefetch.idle_since is not None else prefetch.last_adjust
+    return {
+        "worker": WORKER_NAME,
+        "state": state,
+        "in_flight": in_flight,
+        "idle_seconds": round(prefetch.clock() - idle_since, 3) if not in_flight else 0.0
+    }
+
+def stop_consuming():
+    global running
+    running = False
+    channel.stop_consuming()
+
+def request_drain():
+    """From the status thread: the connection thread stops consuming once the
+    message it is on is settled; prefetched but unstarted messages are requeued
+    when the connection closes. Returns False if already draining."""
+    global draining
+    if draining:
+        return False
+    draining = True
+    logger.info("Drain requested, finishing in-flight work and exiting")
+    return True
+
+class StatusHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass  # polled by the autoscaler, keep the log for messages
+
+    def reply(self, code, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/status":
+            self.reply(200, worker_status())
+        else:
+            self.reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path == "/drain":
+            first = request_drain()
+            # Reply before the connection thread can stop and exit the process
+            self.reply(202, worker_status())
+            if first:
+                connection.add_callback_threadsafe(stop_consuming)
+        else:
+            self.reply(404, {"error": "not found"})
+
+if WORKER_STATUS_PORT:
+    try:
+        status_server = ThreadingHTTPServer(("0.0.0.0", WORKER_STATUS_PORT), StatusHandler)
+        status_server.daemon_threads = True
+        threading.Thread(target=status_server.serve_forever, name="status", daemon=True).start()
+        logger.info(f"Status endpoint on port {WORKER_STATUS_PORT}")
+    except OSError as e:
+        logger.error(f"ERROR: Failed to start status endpoint: {e}")
+
+def adjust_prefetch(ch):
+    if not ADAPTIVE_PREFETCH:
+        return
+    try:
+        new_prefetch = prefetch.maybe_adjust(lambda n: ch.basic_qos(prefetch_count=n))
+        if new_prefetch is not None:
+            logger.info(f"Prefetch set to {new_prefetch}: {prefetch.get_stats()}")
+    except Exception as e:
+        logger.error(f"Error adjusting prefetch: {e}")
+
+def trace_dequeue(properties, message, delivered_ns):
+    """'dequeue' span from the publisher's timestamp to delivery; returns the
+    publisher's span context, or None for untraced messages"""
+    parent = tracer.extract(getattr(properties, 'headers', None))
+    if parent is None:
+        return None
+    queued_ns = delivered_ns
+    if isinstance(message, dict) and isinstance(message.get('timestamp'), str):
+        try:
+            published = datetime.fromisoformat(message['timestamp']).replace(tzinfo=timezone.utc)
+            queued_ns = min(delivered_ns, int(published.timestamp() * 1e9))
+        except ValueError:
+            pass
+    tracer.start_span("dequeue", parent, tracing.CONSUMER, start_ns=queued_ns,
+                      attributes={"messaging.destination.name": QUEUE_NAME, "worker": WORKER_NAME}).end(delivered_ns)
+    return parent
+
+def trace_settle(parent, processing_started_ns, settle_started_ns, outcome, batch_size=None):
+    attributes = {"worker": WORKER_NAME}
+    if batch_size:
+        attributes["batch_size"] = batch_size
+    tracer.start_span("process", parent, start_ns=processing_started_ns, attributes=attributes).end(
+        settle_started_ns, error=None if outcome == "ack" else "processing failed")
+    tracer.start_span("ack", parent, tracing.CONSUMER, start_ns=settle_started_ns,
+                      attributes={"messaging.settle.outcome": outcome}).end()
+
 def callback(ch, method, properties, body):
     start_time = time.time()
+    delivered_ns = time.time_ns()
+    prefetch.message_started()
+    trace_parent = None
     try:
-        message = body.decode()
+        try:
+            message = message_codecs.decode_message(body, properties)
+        except message_codecs.MessageDecodeError:
+            # Not in a known format (e.g. plain text from another producer), log it as-is
+            message = body.decode(errors='replace')
+        trace_parent = trace_dequeue(properties, message, delivered_ns)
         logger.info(f" [>] Processing message: {message}")
         time.sleep(5)  # simulate work
+        settle_started_ns = time.time_ns()
         ch.basic_ack(delivery_tag=method.delivery_tag)
+        if trace_parent:
+            trace_settle(trace_parent, delivered_ns, settle_started_ns, "ack")
         processing_time = time.time() - start_time
         logger.info(f"Completed processing in {processing_time:.2f}s")
+        stats = message_codecs.decompression_stats.to_dict()
+        if stats['messages'] and stats['messages'] % COMPRESSION_LOG_EVERY == 0:
+            logger.info(f"Decompression stats: {stats}")
+            logger.info(f"Prefetch stats: {prefetch.get_stats()}")
     except Exception as e:
         logger.error(f"Error processing message: {e}")
         # Reject and requeue message on error
+        settle_started_ns = time.time_ns()
         ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+        if trace_parent:
+            trace_settle(trace_parent, delivered_ns, settle_started_ns, "requeue")
+    prefetch.message_finished(time.time() - start_time)
+    adjust_prefetch(ch)
+
+# Batch state; only touched from the connection thread
+pending = []
+linger_timer = None
+
+def decode_body(body, properties):
+    try:
+        return message_codecs.decode_message(body, properties)
+    except message_codecs.MessageDecodeError:
+        return None
+
+def flush_batch(timer_fired=False):
+    global pending, linger_timer
+    if linger_timer is not None and not timer_fired:
+        connection.remove_timeout(linger_timer)
+    linger_timer = None
+    batch, pending = pending, []
+    if not batch:
+        return
+    start_time = time.time()
+    processing_started_ns = time.time_ns()
+    last_tag = batch[-1][0]
+    trace_parents = []
+    outcome = "ack"
+    try:
+        messages = [decode_body(body, properties) for _, properties, body, _ in batch]
+        trace_parents = [trace_dequeue(properties, message, delivered_ns)
+                         for (_, properties, _, delivered_ns), message in zip(batch, messages)]
+        summary = batch_handler.handle(messages)
+        # Deliveries on a channel are tagged in order, one ack settles the whole batch
+        settle_started_ns = time.time_ns()
+        channel.basic_ack(delivery_tag=last_tag, multiple=True)
+        logger.info(f"Completed batch of {len(batch)} in {time.time() - start_time:.3f}s: {summary}")
+    except Exception as e:
+        logger.error(f"Error processing batch of {len(batch)}: {e}")
+        outcome = "requeue"
+        settle_started_ns = time.time_ns()
+        channel.basic_nack(delivery_tag=last_tag, multiple=True, requeue=True)
+    for trace_parent in trace_parents:
+        if trace_parent:
+            trace_settle(trace_parent, processing_started_ns, settle_started_ns, outcome, batch_size=len(batch))
+    prefetch.message_finished(time.time() - start_time, count=len(batch))
+    adjust_prefetch(channel)
+
+def batch_callback(ch, method, properties, body):
+    global linger_timer
+    prefetch.message_started()
+    pending.append((method.delivery_tag, properties, body, time.time_ns()))
+    if len(pending) >= BATCH_SIZE:
+        flush_batch()
+    elif linger_timer is None:
+        linger_timer = connection.call_later(BATCH_LINGER_MS / 1000, lambda: flush_batch(timer_fired=True))
+
+if batch_handler:
+    logger.info(f"Batch mode: up to {BATCH_SIZE} messages, {BATCH_LINGER_MS:.0f}ms linger, handler '{BATCH_HANDLER}'")
+    consumer_callback = batch_callback
+else:
+    consumer_callback = callback
+
+if WARM_STANDBY and activation_requested_at is None:
+    logger.info("Warm standby: connected, waiting for activation")
+    # Short slices keep heartbeats flowing and bound the activation latency
+    while running and activation_requested_at is None:
+        connection.process_data_events(time_limit=0.05)
+    if activation_requested_at is not None:
+        logger.info(f"Activated after {(time.monotonic() - activation_requested_at) * 1000:.1f}ms, starting to consume")
 
-channel.basic_qos(prefetch_count=1)
-channel.basic_consume(queue=QUEUE_NAME, on_message_callback=callback)
+# Prefetch starts at one message per slot (a full batch in batch mode, or
+# batches never fill); the Qos-Ok round trip is the first RTT sample
+qos_started = time.monotonic()
+channel.basic_qos(prefetch_count=prefetch.prefetch)
+prefetch.record_rtt(time.monotonic() - qos_started)
+if running:
+    channel.basic_consume(queue=QUEUE_NAME, on_message_callback=consumer_callback)
 
 try:
     while running:
@@ -99,6 +343,9 @@ try:
 except Exception as e:
     logger.error(f"ERROR: Worker error: {e}")
 finally:
+    if pending and connection and connection.is_open:
+        # Work on what was already delivered rather than letting it be redelivered
+        flush_batch()
     logger.info("Cleaning up connection...")
     if connection and not connection.is_closed:
         try:
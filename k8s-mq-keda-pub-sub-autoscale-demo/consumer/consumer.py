@@ -1,19 +1,67 @@
 import pika
-import json
 import time
 import os
 import sys
 import signal
 import threading
-from datetime import datetime
-from flask import Flask, jsonify
+import functools
+import math
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timezone
+from flask import Flask, Response, jsonify
 import logging
 import re
+import message_codecs
+from prefetch_controller import PrefetchController
+import metrics
+import tracing
+from handlers import init_process_worker, run_handler
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Continues the publisher's trace (traceparent header) with dequeue, process and ack spans
+tracer = tracing.Tracer.from_env('consumer')
+
+def detect_cpu_quota():
+    """Number of CPUs the container may use: the cgroup CPU limit rounded up,
+    falling back to the host CPU count when there is no limit"""
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        try:
+            # cgroup v1
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+                quota = int(f.read())
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+                period = int(f.read())
+            if quota > 0:
+                return max(1, math.ceil(quota / period))
+        except (OSError, ValueError):
+            pass
+    return os.cpu_count() or 1
+
+def queue_wait_seconds(message_data, now):
+    """Seconds since the publisher stamped the message (its naive-UTC `timestamp`),
+    None when there is no usable timestamp"""
+    timestamp = message_data.get('timestamp')
+    if not isinstance(timestamp, str):
+        return None
+    try:
+        published = datetime.fromisoformat(timestamp)
+    except ValueError:
+        return None
+    if published.tzinfo is None:
+        published = published.replace(tzinfo=timezone.utc)
+    # Clock skew between publisher and consumer must not produce negative waits
+    return max(0.0, now - published.timestamp())
+
 class RabbitMQConsumer:
     def __init__(self):
         # Handle Kubernetes environment variables properly
@@ -40,6 +88,75 @@ class RabbitMQConsumer:
         self.min_processing_time = float(os.getenv('MIN_PROCESSING_TIME', '3.0'))
         self.max_processing_time = float(os.getenv('MAX_PROCESSING_TIME', '7.0'))
         
+        # Batch consumption: collect up to BATCH_SIZE messages or wait BATCH_TIMEOUT_MS,
+        # process them together and ack them with one basic_ack(multiple=True)
+        self.batch_size = max(1, int(os.getenv('BATCH_SIZE', '1')))
+        self.batch_timeout = float(os.getenv('BATCH_TIMEOUT_MS', '200')) / 1000
+        self.pending_batch = []
+        self.batch_timer = None
+        self.batches_processed = 0
+        self.ack_frames = 0
+        
+        # Concurrency: messages processed at once by this pod. 'inline' runs the
+        # handler on the pika I/O thread (one at a time), 'thread' uses a worker pool,
+        # 'process' a process pool sized to the container's CPU quota for CPU-bound handlers,
+        # 'batch' runs process_batch on the I/O thread
+        self.processing_mode = os.getenv('PROCESSING_MODE', '')
+        concurrency_env = os.getenv('CONSUMER_CONCURRENCY')
+        if self.processing_mode == 'process' and not concurrency_env:
+            self.concurrency = detect_cpu_quota()
+        else:
+            self.concurrency = max(1, int(concurrency_env or '1'))
+        if not self.processing_mode:
+            if self.batch_size > 1:
+                self.processing_mode = 'batch'
+            else:
+                self.processing_mode = 'thread' if self.concurrency > 1 else 'inline'
+        # Prefetch matches the concurrency limit so the broker never hands this pod
+        # more unacked messages than it can work on
+        self.prefetch_count = int(os.getenv('PREFETCH_COUNT', str(self.concurrency)))
+        if self.processing_mode == 'batch' and self.prefetch_count < self.batch_size:
+            # A smaller prefetch would cap every batch below BATCH_SIZE and leave
+            # each one waiting out the full timeout
+            self.prefetch_count = self.batch_size
+        
+        # Adaptive prefetch: deepen the local buffer just enough to hide the network
+        # round trip, re-evaluated every PREFETCH_ADJUST_INTERVAL seconds. Idle gaps
+        # and the computed target are tracked (and shown on /stats) either way.
+        self.adaptive_prefetch = os.getenv('ADAPTIVE_PREFETCH', 'false').lower() == 'true'
+        slots = self.batch_size if self.processing_mode == 'batch' else self.concurrency
+        self.prefetch_controller = PrefetchController(
+            concurrency=slots,
+            initial=self.prefetch_count,
+            min_prefetch=int(os.getenv('PREFETCH_MIN', str(slots))),
+            max_prefetch=int(os.getenv('PREFETCH_MAX', str(max(slots, 50)))),
+            adjust_interval=float(os.getenv('PREFETCH_ADJUST_INTERVAL', '5'))
+        )
+        
+        # Prometheus metrics served on /metrics
+        self.metrics = metrics.Registry()
+        self.processing_seconds = self.metrics.register(metrics.Histogram(
+            'consumer_processing_duration_seconds', 'Time from delivery to ack/nack in this consumer'))
+        self.end_to_end_seconds = self.metrics.register(metrics.Histogram(
+            'consumer_end_to_end_latency_seconds', 'Time from the publisher timestamp to ack'))
+        self.queue_wait_seconds = self.metrics.register(metrics.Histogram(
+            'consumer_queue_wait_seconds', 'Time from the publisher timestamp to delivery'))
+        self.messages_total = self.metrics.register(metrics.Counter(
+            'consumer_messages_total', 'Messages settled by outcome', 'outcome', ('ack', 'requeue', 'drop')))
+        self.metrics.register(metrics.Gauge(
+            'consumer_in_flight_messages', 'Messages dispatched to workers and not yet settled', lambda: self.in_flight))
+        self.metrics.register(metrics.Gauge(
+            'consumer_prefetch', 'Current basic_qos prefetch count', lambda: self.prefetch_count))
+        self.executor = None
+        self.in_flight = 0
+        # delivery_tag -> publisher SpanContext for traced messages; connection thread only
+        self.trace_contexts = {}
+        
+        # Inline handlers block the I/O thread, hence the long default heartbeat;
+        # with a worker pool the connection thread stays responsive
+        default_heartbeat = '600' if self.processing_mode in ('inline', 'batch') else '60'
+        self.heartbeat = int(os.getenv('RABBITMQ_HEARTBEAT', default_heartbeat))
+        
         # Connection objects
         self.connection = None
         self.channel = None
@@ -57,6 +174,7 @@ class RabbitMQConsumer:
         logger.info(f"Consumer {self.consumer_id} initialized")
         logger.info(f"RabbitMQ: {self.rabbitmq_host}:{self.rabbitmq_port}, Queue: {self.queue_name}")
         logger.info(f"Processing time range: {self.min_processing_time}s - {self.max_processing_time}s")
+        logger.info(f"Processing mode: {self.processing_mode}, concurrency: {self.concurrency}, prefetch: {self.prefetch_count}")
         
     def connect(self):
         """Connect to RabbitMQ with retry logic"""
@@ -75,19 +193,24 @@ class RabbitMQConsumer:
                     connection_attempts=3,
                     retry_delay=2,
                     socket_timeout=10,
-                    heartbeat=600,
+                    heartbeat=self.heartbeat,
                     blocked_connection_timeout=300
                 )
                 
                 self.connection = pika.BlockingConnection(parameters)
                 self.channel = self.connection.channel()
+                # Delivery tags restart with the new channel
+                self.trace_contexts.clear()
                 
                 # Declare queue (idempotent)
                 self.channel.queue_declare(queue=self.queue_name, durable=True)
                 
-                # ✅ CRITICAL: Set QoS to process one message at a time per consumer
+                # ✅ CRITICAL: Limit unacked messages to what this consumer works on at once
                 # This ensures RabbitMQ distributes messages fairly across all consumers
-                self.channel.basic_qos(prefetch_count=1)
+                qos_started = time.monotonic()
+                self.channel.basic_qos(prefetch_count=self.prefetch_count)
+                # basic_qos waits for Qos-Ok, so it doubles as an RTT sample
+                self.prefetch_controller.record_rtt(time.monotonic() - qos_started)
                 
                 logger.info(f"[{self.consumer_id}] Successfully connected to RabbitMQ, consuming from queue: {self.queue_name}")
                 return True
@@ -103,78 +226,245 @@ class RabbitMQConsumer:
     
     def process_message(self, message_data):
         """Simulate message processing work"""
-        try:
-            # Extract message info
-            message_id = message_data.get('id', 'unknown')
-            data = message_data.get('data', 'no data')
-            timestamp = message_data.get('timestamp', 'no timestamp')
-            
-            logger.info(f"[{self.consumer_id}] 🔄 STARTED processing message {message_id}: {data}")
-            
-            # Simulate variable processing time (real work would go here)
-            import random
-            processing_time = random.uniform(self.min_processing_time, self.max_processing_time)
-            
-            logger.info(f"[{self.consumer_id}] ⏳ Processing message {message_id} for {processing_time:.2f}s")
-            
-            # Simulate the actual work with progress indication
-            steps = 4
-            step_time = processing_time / steps
-            
-            for step in range(1, steps + 1):
-                time.sleep(step_time)
-                logger.info(f"[{self.consumer_id}] 📈 Message {message_id} - Step {step}/{steps} complete")
-            
-            # Simulate occasional failures (3% failure rate - reduced for better demo)
-            if random.random() < 0.03:
-                raise Exception("Simulated processing failure")
-            
-            logger.info(f"[{self.consumer_id}] ✅ COMPLETED processing message {message_id}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"[{self.consumer_id}] ❌ ERROR processing message: {e}")
-            return False
+        return run_handler(message_data, self.consumer_id, self.min_processing_time, self.max_processing_time)
+    
+    def process_batch(self, messages):
+        """Process a batch of decoded messages; returns one success flag per message.
+        Override for handlers that work on the whole batch at once."""
+        return [self.process_message(message_data) for message_data in messages]
     
     def message_callback(self, ch, method, properties, body):
         """Callback function for processing received messages"""
         message_start_time = time.time()
         
         try:
-            # Parse the message
-            message_data = json.loads(body.decode('utf-8'))
+            # Decode with the codec named by the message's content_type
+            message_data = message_codecs.decode_message(body, properties)
             message_id = message_data.get('id', 'unknown')
             
             logger.info(f"[{self.consumer_id}] 📥 RECEIVED message {message_id} from queue")
+            self.prefetch_controller.message_started()
+            queue_wait = queue_wait_seconds(message_data, message_start_time)
+            if queue_wait is not None:
+                self.queue_wait_seconds.observe(queue_wait)
+            self._trace_delivery(properties, method.delivery_tag, message_id, message_start_time, queue_wait)
+            
+            if self.processing_mode == 'batch':
+                self.pending_batch.append((method.delivery_tag, message_id, message_data, message_start_time, queue_wait))
+                if len(self.pending_batch) >= self.batch_size:
+                    self._flush_batch(ch)
+                elif self.batch_timer is None:
+                    self.batch_timer = self.connection.call_later(
+                        self.batch_timeout, functools.partial(self._flush_batch, ch, timer_fired=True))
+                return
+            
+            if self.processing_mode == 'process':
+                # Decoded message goes to a worker process; the result comes back
+                # on a pool thread and is marshalled to the connection thread
+                future = self.executor.submit(run_handler, message_data, self.consumer_id,
+                                              self.min_processing_time, self.max_processing_time)
+                self.in_flight += 1
+                future.add_done_callback(functools.partial(
+                    self._on_process_done, self.connection, ch, method.delivery_tag, message_id, message_start_time, queue_wait))
+                return
+            
+            if self.executor:
+                # Hand off to the worker pool; the I/O thread stays free for
+                # heartbeats and further deliveries
+                self.executor.submit(self._process_in_worker, self.connection, ch, method.delivery_tag,
+                                     message_id, message_data, message_start_time, queue_wait)
+                self.in_flight += 1
+                return
             
             # Process the message
             success = self.process_message(message_data)
+            self._settle(ch, method.delivery_tag, message_id, success, message_start_time, queue_wait)
+                
+        except message_codecs.MessageDecodeError as e:
+            logger.error(f"[{self.consumer_id}] Invalid message body: {e}")
+            # Reject invalid messages without requeue
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+            self.messages_failed += 1
+            self.messages_total.inc('drop')
             
-            processing_duration = time.time() - message_start_time
-            
+        except Exception as e:
+            logger.error(f"[{self.consumer_id}] Unexpected error processing message: {e}")
+            # Reject and requeue for retry
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            self.messages_failed += 1
+            self.messages_total.inc('requeue')
+            self.trace_contexts.pop(method.delivery_tag, None)
+    
+    def _process_in_worker(self, connection, ch, delivery_tag, message_id, message_data, message_start_time, queue_wait):
+        """Runs on a pool thread. pika channels are not thread-safe, so the ack is
+        marshalled back to the connection thread."""
+        try:
+            success = self.process_message(message_data)
+        except Exception as e:
+            logger.error(f"[{self.consumer_id}] Unexpected error processing message {message_id}: {e}")
+            success = False
+        try:
+            connection.add_callback_threadsafe(functools.partial(
+                self._settle, ch, delivery_tag, message_id, success, message_start_time, queue_wait, dispatched=True))
+        except Exception as e:
+            # Connection is gone; the broker will redeliver the unacked message
+            logger.error(f"[{self.consumer_id}] Cannot settle message {message_id}, connection closed: {e}")
+    
+    def _on_process_done(self, connection, ch, delivery_tag, message_id, message_start_time, queue_wait, future):
+        """Completion callback for process-pool work"""
+        try:
+            success = future.result()
+        except Exception as e:
+            # Includes a worker process dying (BrokenProcessPool)
+            logger.error(f"[{self.consumer_id}] Worker process failed on message {message_id}: {e}")
+            success = False
+        try:
+            connection.add_callback_threadsafe(functools.partial(
+                self._settle, ch, delivery_tag, message_id, success, message_start_time, queue_wait, dispatched=True))
+        except Exception as e:
+            logger.error(f"[{self.consumer_id}] Cannot settle message {message_id}, connection closed: {e}")
+    
+    def _trace_delivery(self, properties, delivery_tag, message_id, message_start_time, queue_wait):
+        """Record the time spent queued as a 'dequeue' span under the publisher's
+        span and remember the context for the process/ack spans"""
+        parent = tracer.extract(getattr(properties, 'headers', None))
+        if parent is None:
+            return
+        delivered_ns = int(message_start_time * 1e9)
+        queued_ns = delivered_ns - int((queue_wait or 0) * 1e9)
+        tracer.start_span('dequeue', parent, tracing.CONSUMER, start_ns=queued_ns, attributes={
+            'messaging.destination.name': self.queue_name,
+            'messaging.message.id': message_id,
+            'messaging.consumer.id': self.consumer_id
+        }).end(delivered_ns)
+        self.trace_contexts[delivery_tag] = parent
+    
+    def _trace_settle(self, parent, processing_started, settle_started_ns, outcome, batch_size=None):
+        """'process' span from delivery (or batch start) to settle, 'ack' span for the ack/nack call"""
+        attributes = {'messaging.consumer.id': self.consumer_id, 'processing_mode': self.processing_mode}
+        if batch_size:
+            attributes['batch_size'] = batch_size
+        tracer.start_span('process', parent, start_ns=int(processing_started * 1e9), attributes=attributes).end(
+            settle_started_ns, error=None if outcome == 'ack' else 'processing failed')
+        tracer.start_span('ack', parent, tracing.CONSUMER, start_ns=settle_started_ns,
+                          attributes={'messaging.settle.outcome': outcome}).end()
+    
+    def _settle(self, ch, delivery_tag, message_id, success, message_start_time, queue_wait=None, dispatched=False):
+        """Ack or requeue a processed message. Always runs on the connection thread."""
+        if dispatched:
+            self.in_flight -= 1
+        trace_parent = self.trace_contexts.pop(delivery_tag, None)
+        settle_started_ns = time.time_ns()
+        processing_duration = time.time() - message_start_time
+        self.prefetch_controller.message_finished(processing_duration)
+        self._adjust_prefetch(ch)
+        try:
             if success:
                 # Acknowledge the message only after successful processing
-                ch.basic_ack(delivery_tag=method.delivery_tag)
+                ch.basic_ack(delivery_tag=delivery_tag)
+                self.ack_frames += 1
                 self.messages_processed += 1
+                self.messages_total.inc('ack')
+                self.processing_seconds.observe(processing_duration)
+                if queue_wait is not None:
+                    self.end_to_end_seconds.observe(queue_wait + processing_duration)
                 self.last_message_time = datetime.utcnow()
                 logger.info(f"[{self.consumer_id}] ✅ Message {message_id} ACKNOWLEDGED (took {processing_duration:.2f}s)")
             else:
                 # Reject and requeue the message for retry
-                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+                ch.basic_nack(delivery_tag=delivery_tag, requeue=True)
                 self.messages_failed += 1
+                self.messages_total.inc('requeue')
+                self.processing_seconds.observe(processing_duration)
                 logger.warning(f"[{self.consumer_id}] 🔄 Message {message_id} REJECTED and REQUEUED")
-                
-        except json.JSONDecodeError as e:
-            logger.error(f"[{self.consumer_id}] Invalid JSON in message: {e}")
-            # Reject invalid messages without requeue
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-            self.messages_failed += 1
-            
+            if trace_parent is not None:
+                self._trace_settle(trace_parent, message_start_time, settle_started_ns, 'ack' if success else 'requeue')
         except Exception as e:
-            logger.error(f"[{self.consumer_id}] Unexpected error processing message: {e}")
-            # Reject and requeue for retry
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
-            self.messages_failed += 1
+            logger.error(f"[{self.consumer_id}] Failed to settle message {message_id}: {e}")
+    
+    def _flush_batch(self, ch, timer_fired=False):
+        """Process the pending batch, nack its failures one by one, then ack the
+        rest with a single basic_ack(multiple=True). Runs on the connection thread."""
+        if self.batch_timer is not None:
+            if not timer_fired:
+                self.connection.remove_timeout(self.batch_timer)
+            self.batch_timer = None
+        batch, self.pending_batch = self.pending_batch, []
+        if not batch:
+            return
+        
+        batch_started = time.time()
+        try:
+            results = self.process_batch([message_data for _, _, message_data, _, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"process_batch returned {len(results)} results for {len(batch)} messages")
+        except Exception as e:
+            logger.error(f"[{self.consumer_id}] Unexpected error processing batch: {e}")
+            results = [False] * len(batch)
+        self.prefetch_controller.message_finished(time.time() - batch_started, count=len(batch))
+        
+        settle_started_ns = time.time_ns()
+        try:
+            # Nack failures first: ack(multiple=True) covers every outstanding tag up
+            # to the one given, and nacked messages are no longer outstanding
+            last_acked_tag = None
+            for (delivery_tag, message_id, _, _, _), success in zip(batch, results):
+                if success:
+                    last_acked_tag = delivery_tag
+                else:
+                    ch.basic_nack(delivery_tag=delivery_tag, requeue=True)
+                    logger.warning(f"[{self.consumer_id}] 🔄 Message {message_id} REJECTED and REQUEUED")
+            if last_acked_tag is not None:
+                ch.basic_ack(delivery_tag=last_acked_tag, multiple=True)
+                self.ack_frames += 1
+        except Exception as e:
+            logger.error(f"[{self.consumer_id}] Failed to settle batch: {e}")
+            for delivery_tag, _, _, _, _ in batch:
+                self.trace_contexts.pop(delivery_tag, None)
+            return
+        
+        settled = time.time()
+        for (delivery_tag, _, _, message_start_time, queue_wait), success in zip(batch, results):
+            trace_parent = self.trace_contexts.pop(delivery_tag, None)
+            if trace_parent is not None:
+                self._trace_settle(trace_parent, batch_started, settle_started_ns,
+                                   'ack' if success else 'requeue', batch_size=len(batch))
+            self.messages_total.inc('ack' if success else 'requeue')
+            self.processing_seconds.observe(settled - message_start_time)
+            if success and queue_wait is not None:
+                self.end_to_end_seconds.observe(queue_wait + settled - message_start_time)
+        
+        succeeded = sum(1 for success in results if success)
+        self.messages_processed += succeeded
+        self.messages_failed += len(batch) - succeeded
+        self.batches_processed += 1
+        if succeeded:
+            self.last_message_time = datetime.utcnow()
+        self._adjust_prefetch(ch)
+        logger.info(f"[{self.consumer_id}] ✅ Batch of {len(batch)} ACKNOWLEDGED ({len(batch) - succeeded} requeued, "
+                    f"took {time.time() - batch[0][3]:.2f}s)")
+    
+    def _adjust_prefetch(self, ch):
+        """Let the controller retune basic_qos; runs on the connection thread"""
+        if not self.adaptive_prefetch:
+            return
+        try:
+            previous = self.prefetch_count
+            new_prefetch = self.prefetch_controller.maybe_adjust(lambda n: ch.basic_qos(prefetch_count=n))
+            if new_prefetch is not None:
+                self.prefetch_count = new_prefetch
+                logger.info(f"[{self.consumer_id}] Prefetch {previous} -> {new_prefetch} "
+                            f"({self.prefetch_controller.get_stats()})")
+        except Exception as e:
+            logger.error(f"[{self.consumer_id}] Failed to adjust prefetch: {e}")
+    
+    def _drain_in_flight(self, timeout=30):
+        """Keep the connection serviced until dispatched messages are settled"""
+        deadline = time.time() + timeout
+        while self.in_flight > 0 and time.time() < deadline:
+            self.connection.process_data_events(time_limit=0.5)
+        if self.in_flight > 0:
+            logger.warning(f"[{self.consumer_id}] {self.in_flight} messages still in flight at shutdown, broker will redeliver")
     
     def start_consuming(self):
         """Start consuming messages from RabbitMQ"""
@@ -183,6 +473,14 @@ class RabbitMQConsumer:
                 logger.error(f"[{self.consumer_id}] Failed to connect to RabbitMQ, cannot start consuming")
                 return False
             
+            if self.processing_mode == 'thread' and self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='consumer-worker')
+            elif self.processing_mode == 'process' and self.executor is None:
+                # spawn, not fork: this process already runs pika and Flask threads
+                self.executor = ProcessPoolExecutor(max_workers=self.concurrency,
+                                                    mp_context=multiprocessing.get_context('spawn'),
+                                                    initializer=init_process_worker)
+            
             # Set up consumer with proper callback
             self.channel.basic_consume(
                 queue=self.queue_name,
@@ -200,6 +498,10 @@ class RabbitMQConsumer:
                 logger.info(f"[{self.consumer_id}] Keyboard interrupt received, stopping consumer...")
                 self.channel.stop_consuming()
             
+            # Let in-flight work finish and get acked before the connection closes
+            self._flush_batch(self.channel)
+            self._drain_in_flight()
+            
             logger.info(f"[{self.consumer_id}] 🛑 STOPPED consuming messages")
             return True
             
@@ -213,6 +515,10 @@ class RabbitMQConsumer:
         """Stop consuming messages and close connections"""
         try:
             self.consuming = False
+            if self.executor:
+                # In-flight work was drained already; this joins the pool's threads/processes
+                self.executor.shutdown(wait=True, cancel_futures=True)
+                self.executor = None
             if self.channel:
                 try:
                     self.channel.stop_consuming()
@@ -237,7 +543,20 @@ class RabbitMQConsumer:
             'connected': self.connection and not self.connection.is_closed,
             'rabbitmq_host': self.rabbitmq_host,
             'rabbitmq_port': self.rabbitmq_port,
-            'queue_name': self.queue_name
+            'queue_name': self.queue_name,
+            'processing_mode': self.processing_mode,
+            'concurrency_limit': self.concurrency,
+            'prefetch_count': self.prefetch_count,
+            'adaptive_prefetch': self.adaptive_prefetch,
+            'prefetch_controller': self.prefetch_controller.get_stats(),
+            'in_flight': self.in_flight,
+            'batch_size': self.batch_size,
+            'batch_timeout_ms': int(self.batch_timeout * 1000),
+            'batches_processed': self.batches_processed,
+            'pending_batch': len(self.pending_batch),
+            'ack_frames': self.ack_frames,
+            'decompression': message_codecs.decompression_stats.to_dict(),
+            'tracing': tracer.get_stats()
         }
     
     def test_connection(self):
@@ -254,12 +573,22 @@ class RabbitMQConsumer:
         """Request graceful shutdown"""
         logger.info(f"[{self.consumer_id}] Graceful shutdown requested")
         self.shutdown_requested = True
+        # Stop taking new work; tasks already running finish and get acked while
+        # start_consuming drains in-flight messages
+        if self.executor:
+            self.executor.shutdown(wait=False)
         if self.channel:
-            self.channel.stop_consuming()
+            if self.connection and self.connection.is_open:
+                # Called from signal handlers and Flask threads: stop on the connection thread
+                self.connection.add_callback_threadsafe(self.channel.stop_consuming)
+            else:
+                self.channel.stop_consuming()
 
 # Flask app for health checks and monitoring
 app = Flask(__name__)
-consumer = RabbitMQConsumer()
+# Created in main(): spawned process-mode workers re-import this module as
+# __mp_main__ and must not build a consumer (config, metrics, connections) each
+consumer = None
 
 @app.route('/', methods=['GET'])
 def health_check():
@@ -290,6 +619,11 @@ def get_stats():
     """Get consumer statistics"""
     return jsonify(consumer.get_stats())
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(consumer.metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
 @app.route('/connection/test', methods=['GET'])
 def test_connection():
     try:
@@ -332,6 +666,9 @@ def run_consumer():
 
 def main():
     """Main function"""
+    global consumer
+    consumer = RabbitMQConsumer()
+    
     # Set up signal handlers for graceful shutdown
     signal.signal(signal.SIGTERM, signal_handler)
     signal.signal(signal.SIGINT, signal_handler)
@@ -0,0 +1,51 @@
+"""Message handlers for the consumer.
+
+Kept apart from consumer.py so PROCESSING_MODE=process workers unpickle
+run_handler from a module without import side effects.
+"""
+import logging
+import random
+import signal
+import time
+
+logger = logging.getLogger(__name__)
+
+def init_process_worker():
+    # The parent owns shutdown; a Ctrl-C or SIGTERM must not kill workers mid-message
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+def run_handler(message_data, consumer_id, min_processing_time, max_processing_time):
+    """Simulate message processing work. Module-level so it can run in a
+    process pool as well as on the consumer's own threads."""
+    try:
+        # Extract message info
+        message_id = message_data.get('id', 'unknown')
+        data = message_data.get('data', 'no data')
+        timestamp = message_data.get('timestamp', 'no timestamp')
+        
+        logger.info(f"[{consumer_id}] 🔄 STARTED processing message {message_id}: {data}")
+        
+        # Simulate variable processing time (real work would go here)
+        processing_time = random.uniform(min_processing_time, max_processing_time)
+        
+        logger.info(f"[{consumer_id}] ⏳ Processing message {message_id} for {processing_time:.2f}s")
+        
+        # Simulate the actual work with progress indication
+        steps = 4
+        step_time = processing_time / steps
+        
+        for step in range(1, steps + 1):
+            time.sleep(step_time)
+            logger.info(f"[{consumer_id}] 📈 Message {message_id} - Step {step}/{steps} complete")
+        
+        # Simulate occasional failures (3% failure rate - reduced for better demo)
+        if random.random() < 0.03:
+            raise Exception("Simulated processing failure")
+        
+        logger.info(f"[{consumer_id}] ✅ COMPLETED processing message {message_id}")
+        return True
+        
+    except Exception as e:
+        logger.error(f"[{consumer_id}] ❌ ERROR processing message: {e}")
+        return False
@@ -0,0 +1,126 @@
+"""Prometheus metrics for the consumer, rendered in the text exposition format.
+
+Updates happen on the message path (connection thread and worker threads),
+so each thread writes to its own shard and never takes a lock; a lock is only
+taken the first time a thread touches a metric and when /metrics merges the
+shards. Under the GIL a scrape can see an observation's bucket before its sum,
+which Prometheus tolerates.
+"""
+import bisect
+import threading
+
+# Seconds; processing runs 3-7s by default, end-to-end latency can reach minutes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 7.5, 10, 15, 30, 60, 120, 300, 600)
+
+class _Sharded:
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+
+    def _new_shard(self):
+        raise NotImplementedError
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = self._new_shard()
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def _snapshot(self):
+        with self._shards_lock:
+            return list(self._shards)
+
+class Histogram(_Sharded):
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        super().__init__()
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_shard(self):
+        # per-bucket counts (last one is +Inf), then [sum]
+        return [0] * (len(self.buckets) + 1), [0.0]
+
+    def observe(self, value):
+        counts, total = self._shard()
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def collect(self):
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        for shard_counts, shard_total in self._snapshot():
+            for i, count in enumerate(shard_counts):
+                counts[i] += count
+            total += shard_total[0]
+        return counts, total
+
+    def render(self):
+        counts, total = self.collect()
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        cumulative += counts[-1]
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {cumulative}")
+        return lines
+
+class Counter(_Sharded):
+    """Counter with a single label; label values are fixed up front"""
+
+    def __init__(self, name, documentation, label, values):
+        super().__init__()
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.values = tuple(values)
+
+    def _new_shard(self):
+        return dict.fromkeys(self.values, 0)
+
+    def inc(self, value, amount=1):
+        self._shard()[value] += amount
+
+    def render(self):
+        totals = dict.fromkeys(self.values, 0)
+        for shard in self._snapshot():
+            for value in self.values:
+                totals[value] += shard[value]
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for value in self.values:
+            lines.append(f'{self.name}{{{self.label}="{value}"}} {totals[value]}')
+        return lines
+
+class Gauge:
+    """Value read from a callback at scrape time"""
+
+    def __init__(self, name, documentation, read):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def render(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge",
+                f"{self.name} {self.read()}"]
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
@@ -0,0 +1,103 @@
+"""Adaptive prefetch (basic_qos) for a consumer.
+
+A consumer with `concurrency` handlers busy for `service_time` each needs
+about `concurrency * rtt / service_time` extra messages buffered locally to
+cover the round trip between an ack and the next delivery. Anything beyond
+that is held back from other replicas for no gain. The controller keeps EWMAs
+of per-message processing time and of network RTT (timed on the synchronous
+basic_qos round trips) and derives the prefetch from them. It does not buffer
+at all while the expected idle time is below `idle_tolerance` of the service
+time, which keeps slow handlers at prefetch == concurrency.
+
+The same file ships with the k8s consumer and the docker worker. All methods
+are called from the connection thread.
+"""
+import math
+import time
+
+class PrefetchController:
+    def __init__(self, concurrency, initial=None, min_prefetch=1, max_prefetch=100,
+                 idle_tolerance=0.02, adjust_interval=5.0, alpha=0.2, clock=time.monotonic):
+        self.concurrency = max(1, concurrency)
+        self.min_prefetch = max(1, min_prefetch)
+        self.max_prefetch = max(self.min_prefetch, max_prefetch)
+        self.idle_tolerance = idle_tolerance
+        self.adjust_interval = adjust_interval
+        self.alpha = alpha
+        self.clock = clock
+
+        self.prefetch = self._clamp(initial or self.concurrency)
+        self.rtt = None
+        self.service_time = None
+        self.adjustments = 0
+        self.last_adjust = clock()
+
+        # Idle gaps: time with no message being processed between two messages
+        self.active = 0
+        self.idle_since = None
+        self.last_idle_gap = 0.0
+        self.idle_gap_ewma = None
+        self.idle_total = 0.0
+
+    def _clamp(self, value):
+        return max(self.min_prefetch, min(self.max_prefetch, int(value)))
+
+    def _ewma(self, current, sample):
+        return sample if current is None else current + self.alpha * (sample - current)
+
+    def record_rtt(self, seconds):
+        self.rtt = self._ewma(self.rtt, seconds)
+
+    def message_started(self):
+        now = self.clock()
+        if self.active == 0 and self.idle_since is not None:
+            gap = now - self.idle_since
+            self.last_idle_gap = gap
+            self.idle_gap_ewma = self._ewma(self.idle_gap_ewma, gap)
+            self.idle_total += gap
+        self.active += 1
+
+    def message_finished(self, processing_seconds, count=1):
+        """`count` > 1 for a batch settled at once; processing_seconds is the whole batch"""
+        self.active = max(0, self.active - count)
+        self.service_time = self._ewma(self.service_time, processing_seconds / count)
+        if self.active == 0:
+            self.idle_since = self.clock()
+
+    def target(self):
+        if not self.rtt or not self.service_time:
+            return self.prefetch
+        idle_ratio = self.rtt / self.service_time
+        extra = math.ceil(self.concurrency * idle_ratio) if idle_ratio > self.idle_tolerance else 0
+        return self._clamp(self.concurrency + extra)
+
+    def maybe_adjust(self, set_prefetch):
+        """Apply a new prefetch via `set_prefetch(n)` when the interval has passed and
+        the target moved. The call is timed as an RTT sample. Returns the new value
+        or None."""
+        now = self.clock()
+        if now - self.last_adjust < self.adjust_interval:
+            return None
+        self.last_adjust = now
+        target = self.target()
+        if target == self.prefetch:
+            return None
+        started = time.monotonic()
+        set_prefetch(target)
+        self.record_rtt(time.monotonic() - started)
+        self.prefetch = target
+        self.adjustments += 1
+        return target
+
+    def get_stats(self):
+        return {
+            'prefetch': self.prefetch,
+            'prefetch_target': self.target(),
+            'prefetch_range': [self.min_prefetch, self.max_prefetch],
+            'prefetch_adjustments': self.adjustments,
+            'rtt_ms': round(self.rtt * 1000, 3) if self.rtt is not None else None,
+            'service_time_ms': round(self.service_time * 1000, 3) if self.service_time is not None else None,
+            'idle_gap_ms': round(self.last_idle_gap * 1000, 3),
+            'idle_gap_avg_ms': round(self.idle_gap_ewma * 1000, 3) if self.idle_gap_ewma is not None else None,
+            'idle_seconds_total': round(self.idle_total, 3)
+        }
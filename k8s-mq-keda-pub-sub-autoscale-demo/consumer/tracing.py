@@ -0,0 +1,246 @@
+"""Minimal tracing: W3C trace context carried in AMQP headers, spans exported
+as OTLP/JSON either to a local file (one export request per line) or to an
+OTLP/HTTP collector.
+
+    TRACING_EXPORTER              none (default) | file | otlp
+    TRACE_FILE                    file exporter path (default /tmp/traces.jsonl)
+    OTEL_EXPORTER_OTLP_ENDPOINT   collector base URL, spans go to <endpoint>/v1/traces
+    OTEL_SERVICE_NAME             overrides the service name the caller passes in
+    TRACE_SAMPLE_RATIO            fraction of new traces recorded (default 1.0)
+
+Spans are queued and exported in batches from a background thread, so ending a
+span on the message path is an append to a bounded queue. With tracing off,
+start_span returns a shared no-op span and nothing is allocated per message.
+
+The same file ships with the publishers, the k8s consumer and the docker worker.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import socket
+import threading
+import time
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT = 'traceparent'
+_TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT, PRODUCER, CONSUMER = 1, 2, 3, 4, 5
+
+class SpanContext:
+    __slots__ = ('trace_id', 'span_id', 'sampled')
+
+    def __init__(self, trace_id, span_id, sampled=True):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+class Span:
+    def __init__(self, tracer, name, context, parent_id, kind, attributes, start_ns):
+        self.tracer = tracer
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def end(self, end_ns=None, error=None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns or time.time_ns()
+        if error is not None:
+            self.error = str(error)
+        self.tracer.processor.on_end(self)
+
+class _NoopSpan:
+    context = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def end(self, end_ns=None, error=None):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        typed = {'boolValue': value}
+    elif isinstance(value, int):
+        typed = {'intValue': str(value)}
+    elif isinstance(value, float):
+        typed = {'doubleValue': value}
+    else:
+        typed = {'stringValue': str(value)}
+    return {'key': key, 'value': typed}
+
+def _otlp_span(span):
+    data = {
+        'traceId': span.context.trace_id,
+        'spanId': span.context.span_id,
+        'name': span.name,
+        'kind': span.kind,
+        'startTimeUnixNano': str(span.start_ns),
+        'endTimeUnixNano': str(span.end_ns),
+        'attributes': [_attribute(k, v) for k, v in span.attributes.items()],
+        'status': {'code': 2, 'message': span.error} if span.error else {'code': 1}
+    }
+    if span.parent_id:
+        data['parentSpanId'] = span.parent_id
+    return data
+
+class FileExporter:
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, payload):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(payload, separators=(',', ':')) + '\n')
+
+class OtlpHttpExporter:
+    def __init__(self, endpoint, timeout=5.0):
+        self.url = endpoint.rstrip('/') + '/v1/traces'
+        self.timeout = timeout
+
+    def export(self, payload):
+        request = urllib.request.Request(self.url, data=json.dumps(payload).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+class BatchSpanProcessor:
+    """Buffers ended spans and exports them every `interval` seconds or every
+    `batch_size` spans. A full buffer drops spans rather than block the caller."""
+
+    def __init__(self, exporter, resource, max_queue=10000, batch_size=512, interval=1.0):
+        self.exporter = exporter
+        self.resource = resource
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0
+        self.exported = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self._run, name='trace-exporter', daemon=True).start()
+        atexit.register(self.flush)
+
+    def on_end(self, span):
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            while True:
+                spans = []
+                while len(spans) < self.batch_size:
+                    try:
+                        spans.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not spans:
+                    return
+                payload = {'resourceSpans': [{
+                    'resource': {'attributes': [_attribute(k, v) for k, v in self.resource.items()]},
+                    'scopeSpans': [{'scope': {'name': 'mq-demo-tracing'}, 'spans': [_otlp_span(s) for s in spans]}]
+                }]}
+                try:
+                    self.exporter.export(payload)
+                    self.exported += len(spans)
+                except Exception as e:
+                    self.failed += len(spans)
+                    logger.warning(f"Failed to export {len(spans)} spans: {e}")
+
+    def get_stats(self):
+        return {'exported': self.exported, 'failed': self.failed, 'dropped': self.dropped,
+                'queued': self.queue.qsize()}
+
+class Tracer:
+    def __init__(self, processor=None, sample_ratio=1.0):
+        self.processor = processor
+        self.sample_ratio = sample_ratio
+
+    @classmethod
+    def from_env(cls, service_name):
+        exporter_name = os.getenv('TRACING_EXPORTER', 'none').lower()
+        if exporter_name == 'file':
+            exporter = FileExporter(os.getenv('TRACE_FILE', '/tmp/traces.jsonl'))
+        elif exporter_name == 'otlp':
+            exporter = OtlpHttpExporter(os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT', 'http://otel-collector:4318'))
+        else:
+            return cls()
+        resource = {
+            'service.name': os.getenv('OTEL_SERVICE_NAME', service_name),
+            'service.instance.id': socket.gethostname()
+        }
+        return cls(BatchSpanProcessor(exporter, resource), float(os.getenv('TRACE_SAMPLE_RATIO', '1.0')))
+
+    @property
+    def enabled(self):
+        return self.processor is not None
+
+    def start_span(self, name, parent=None, kind=INTERNAL, attributes=None, start_ns=None):
+        """Start a span under `parent` (a Span or SpanContext); without one a new
+        trace is started, subject to sampling"""
+        if not self.enabled:
+            return NOOP_SPAN
+        if isinstance(parent, Span):
+            parent = parent.context
+        if parent is not None:
+            if not parent.sampled:
+                return NOOP_SPAN
+            context = SpanContext(parent.trace_id, f'{random.getrandbits(64):016x}')
+            parent_id = parent.span_id
+        else:
+            if random.random() >= self.sample_ratio:
+                return NOOP_SPAN
+            context = SpanContext(f'{random.getrandbits(128):032x}', f'{random.getrandbits(64):016x}')
+            parent_id = None
+        return Span(self, name, context, parent_id, kind, attributes, start_ns)
+
+    def inject(self, span, headers):
+        """Add the span's traceparent to an AMQP headers dict"""
+        if span.context is not None:
+            headers[TRACEPARENT] = span.context.traceparent()
+        return headers
+
+    def extract(self, headers):
+        """SpanContext from AMQP headers, or None"""
+        if not headers or not self.enabled:
+            return None
+        value = headers.get(TRACEPARENT)
+        if isinstance(value, bytes):
+            value = value.decode('ascii', errors='replace')
+        match = _TRACEPARENT_RE.match(value or '')
+        if not match:
+            return None
+        trace_id, span_id, flags = match.groups()
+        return SpanContext(trace_id, span_id, bool(int(flags, 16) & 1))
+
+    def get_stats(self):
+        if not self.enabled:
+            return {'enabled': False}
+        return dict(self.processor.get_stats(), enabled=True, sample_ratio=self.sample_ratio)
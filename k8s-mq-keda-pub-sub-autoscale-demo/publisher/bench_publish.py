@@ -0,0 +1,57 @@
+"""Micro-benchmark for the per-message publish overhead.
+
+Compares the old hot path (a connection poll via ensure_connection() before
+every publish) with the current one (serialization + basic_publish only)
+against a live broker, using the same environment variables as the publisher:
+
+    docker compose exec publisher python bench_publish.py --count 20000
+"""
+import argparse
+import logging
+import time
+
+from common import logger
+from rabbitmq_publisher import RabbitMQPublisher
+
+def run(publisher, count, poll_before_publish):
+    started = time.perf_counter()
+    for i in range(count):
+        if poll_before_publish:
+            # What publish_message used to do on every call
+            publisher.ensure_connection()
+        publisher.publish_message(f"bench message {i}")
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure per-message publish overhead")
+    parser.add_argument('--count', type=int, default=10000, help="messages per run")
+    parser.add_argument('--rounds', type=int, default=3, help="runs per mode, best one is reported")
+    parser.add_argument('--queue', default='publisher_bench', help="scratch queue, deleted afterwards")
+    args = parser.parse_args()
+
+    # Per-message INFO logging would dominate the measurement
+    logger.setLevel(logging.WARNING)
+
+    # Publish to a scratch queue so the benchmark doesn't feed the workers
+    publisher = RabbitMQPublisher()
+    publisher.queue_name = args.queue
+    if not publisher.connect():
+        raise SystemExit("Cannot connect to RabbitMQ")
+
+    # Warm up connection, channel and interpreter caches
+    run(publisher, min(1000, args.count), poll_before_publish=False)
+
+    results = {}
+    for label, poll in (('poll before publish (old)', True), ('hot path only (new)', False)):
+        best = min(run(publisher, args.count, poll) for _ in range(args.rounds))
+        results[label] = best
+        print(f"{label:28s} {best / args.count * 1e6:8.2f} us/msg  {args.count / best:10.0f} msgs/s")
+
+    old, new = results.values()
+    print(f"per-message overhead removed: {(old - new) / args.count * 1e6:.2f} us ({old / new:.2f}x)")
+
+    publisher.channel.queue_delete(queue=args.queue)
+    publisher.reset_connection()
+
+if __name__ == '__main__':
+    main()
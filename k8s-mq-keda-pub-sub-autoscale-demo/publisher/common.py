@@ -0,0 +1,71 @@
+"""Message format and process-wide state shared by the publisher entry points.
+
+Imported by publisher.py (Flask), async_publisher.py (aiohttp) and the
+benchmark, so importing it must not open connections, start pools or build an
+app; only logging and the tracer are set up here.
+"""
+import itertools
+import logging
+import os
+import re
+from datetime import datetime
+
+import message_codecs
+import tracing
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('publisher')
+
+# Spans for publish and broker confirm; trace context travels in the AMQP headers
+tracer = tracing.Tracer.from_env('publisher')
+
+# Message ids are shared by every pooled connection so they stay unique per process
+message_ids = itertools.count()
+
+# Body format for messages that don't ask for one; consumers decode by content_type
+DEFAULT_CONTENT_TYPE = os.getenv('MESSAGE_CONTENT_TYPE', message_codecs.JSON)
+
+# Optional body compression (gzip, zstd, lz4) for bodies of at least the threshold
+# size, signalled via content_encoding so consumers decompress transparently
+MESSAGE_COMPRESSION = os.getenv('MESSAGE_COMPRESSION', 'none')
+MESSAGE_COMPRESSION_THRESHOLD = int(os.getenv('MESSAGE_COMPRESSION_THRESHOLD', '1024'))
+
+def parse_rabbitmq_port(rabbitmq_port_env):
+    """Parse RABBITMQ_PORT, which Kubernetes may set to tcp://host:port"""
+    if rabbitmq_port_env.startswith('tcp://'):
+        # Extract port from tcp://host:port format
+        port_match = re.search(r':(\d+)$', rabbitmq_port_env)
+        return int(port_match.group(1)) if port_match else 5672
+    try:
+        return int(rabbitmq_port_env)
+    except ValueError:
+        logger.warning(f"Could not parse port from {rabbitmq_port_env}, using default 5672")
+        return 5672
+
+def prepare_message(message_data, message_id, content_type=None, span=None):
+    """Wrap the payload and return the message body plus AMQP properties.
+    Properties are a plain dict so both the pika and the asyncio publisher can use them.
+    A recording `span` is propagated to consumers as a traceparent header."""
+    content_type = content_type or DEFAULT_CONTENT_TYPE
+    enhanced_message = {
+        'id': message_id,
+        'data': message_data,
+        'timestamp': datetime.utcnow().isoformat(),
+        'source': 'publisher'
+    }
+    properties = {
+        'delivery_mode': 2,  # Persistent message
+        'content_type': content_type
+    }
+    body, content_encoding = message_codecs.compress(
+        message_codecs.encode(enhanced_message, content_type),
+        MESSAGE_COMPRESSION, MESSAGE_COMPRESSION_THRESHOLD
+    )
+    if content_encoding:
+        properties['content_encoding'] = content_encoding
+    if span is not None and span.context is not None:
+        span.set_attribute('messaging.message.id', message_id)
+        span.set_attribute('messaging.message.body.size', len(body))
+        properties['headers'] = tracer.inject(span, {})
+    return body, properties
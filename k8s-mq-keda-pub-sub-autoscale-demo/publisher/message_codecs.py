@@ -0,0 +1,274 @@
+"""Message body codecs keyed by AMQP content_type, plus optional compression
+signalled through content_encoding.
+
+Publishers encode with the codec for the content_type they set on the
+message; consumers pick the decoder from the message properties, so queues
+can carry a mix of formats during a rollout. The same file ships with the
+publisher, the k8s consumer and the docker worker.
+"""
+import gzip
+import json
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+
+# Fast paths are optional: without orjson we fall back to the stdlib json
+# module, without msgpack the msgpack codec is simply not registered
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+ENVELOPE = 'application/x-mq-envelope'
+
+class MessageDecodeError(ValueError):
+    """Body could not be decoded with the codec its content_type names"""
+
+class UnsupportedContentType(ValueError):
+    """No codec is registered for the content_type"""
+
+class JsonCodec:
+    content_type = JSON
+
+    def encode(self, obj):
+        if orjson:
+            return orjson.dumps(obj)
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def decode(self, body):
+        if orjson:
+            return orjson.loads(body)
+        return json.loads(body.decode('utf-8') if isinstance(body, (bytes, bytearray)) else body)
+
+class MsgpackCodec:
+    content_type = MSGPACK
+
+    def encode(self, obj):
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def decode(self, body):
+        return msgpack.unpackb(body, raw=False)
+
+class EnvelopeCodec:
+    """Compact binary form of the publisher's message shape:
+
+        version:u8 flags:u8 id:i64 timestamp_us:i64
+        source_len:u8 source  container_len:u8 container  data...
+
+    The fixed fields travel as binary instead of JSON keys and an ISO string;
+    `data` is msgpack when available (flag bit 0) and JSON otherwise.
+    """
+    content_type = ENVELOPE
+    VERSION = 1
+    HEADER = struct.Struct('!BBqq')
+    FIELDS = {'id', 'data', 'timestamp', 'source', 'publisher_container_id'}
+    FLAG_MSGPACK_DATA = 0x01
+
+    def encode(self, obj):
+        unknown = set(obj) - self.FIELDS
+        if unknown:
+            raise ValueError(f"Envelope cannot carry fields {sorted(unknown)}")
+
+        timestamp_us = 0
+        if obj.get('timestamp'):
+            ts = datetime.fromisoformat(obj['timestamp']).replace(tzinfo=timezone.utc)
+            timestamp_us = int(ts.timestamp()) * 1_000_000 + ts.microsecond
+        source = obj.get('source', '').encode('utf-8')[:255]
+        container = (obj.get('publisher_container_id') or '').encode('utf-8')[:255]
+
+        flags = 0
+        if msgpack:
+            flags |= self.FLAG_MSGPACK_DATA
+            data = msgpack.packb(obj.get('data'), use_bin_type=True)
+        else:
+            data = JsonCodec().encode(obj.get('data'))
+
+        return b''.join([
+            self.HEADER.pack(self.VERSION, flags, obj.get('id', -1), timestamp_us),
+            bytes([len(source)]), source,
+            bytes([len(container)]), container,
+            data
+        ])
+
+    def decode(self, body):
+        body = memoryview(body)
+        version, flags, message_id, timestamp_us = self.HEADER.unpack_from(body)
+        if version != self.VERSION:
+            raise ValueError(f"Unsupported envelope version {version}")
+        offset = self.HEADER.size
+        source_len = body[offset]
+        source = bytes(body[offset + 1:offset + 1 + source_len]).decode('utf-8')
+        offset += 1 + source_len
+        container_len = body[offset]
+        container = bytes(body[offset + 1:offset + 1 + container_len]).decode('utf-8')
+        offset += 1 + container_len
+
+        data = bytes(body[offset:])
+        if flags & self.FLAG_MSGPACK_DATA:
+            if msgpack is None:
+                raise ValueError("Envelope data is msgpack but msgpack is not installed")
+            data = msgpack.unpackb(data, raw=False)
+        else:
+            data = JsonCodec().decode(data)
+
+        message = {'id': message_id, 'data': data, 'source': source}
+        if timestamp_us:
+            seconds, micros = divmod(timestamp_us, 1_000_000)
+            message['timestamp'] = datetime.utcfromtimestamp(seconds).replace(microsecond=micros).isoformat()
+        if container:
+            message['publisher_container_id'] = container
+        return message
+
+CODECS = {}
+
+def register_codec(codec):
+    CODECS[codec.content_type] = codec
+
+register_codec(JsonCodec())
+register_codec(EnvelopeCodec())
+if msgpack:
+    register_codec(MsgpackCodec())
+
+def _normalize(content_type):
+    # "application/json; charset=utf-8" -> "application/json"; no content_type means JSON
+    if not content_type:
+        return JSON
+    return content_type.split(';', 1)[0].strip().lower()
+
+def is_supported(content_type):
+    return _normalize(content_type) in CODECS
+
+def get_codec(content_type):
+    codec = CODECS.get(_normalize(content_type))
+    if codec is None:
+        raise UnsupportedContentType(f"No codec for content type '{content_type}'")
+    return codec
+
+def encode(obj, content_type=JSON):
+    return get_codec(content_type).encode(obj)
+
+def decode(body, content_type=None):
+    """Decode a body using the codec for its content_type"""
+    try:
+        return get_codec(content_type).decode(body)
+    except Exception as e:
+        raise MessageDecodeError(f"Cannot decode {_normalize(content_type)} body: {e}") from e
+
+# ========================
+# COMPRESSION
+# ========================
+class CompressionStats:
+    """Bytes in/out and CPU time spent (de)compressing, to judge per queue
+    whether compression pays off"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.messages = 0
+        self.compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_seconds = 0.0
+
+    def record(self, bytes_in, bytes_out, cpu_seconds, compressed):
+        with self.lock:
+            self.messages += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.cpu_seconds += cpu_seconds
+            if compressed:
+                self.compressed += 1
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'messages': self.messages,
+                'compressed': self.compressed,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'ratio': round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else 1.0,
+                'cpu_seconds': round(self.cpu_seconds, 6),
+                'cpu_us_per_message': round(self.cpu_seconds / self.messages * 1e6, 2) if self.messages else 0.0
+            }
+
+compression_stats = CompressionStats()    # publisher side: raw -> wire
+decompression_stats = CompressionStats()  # consumer side: wire -> raw
+
+# zstd (de)compressor objects are not safe to share between threads
+_zstd_local = threading.local()
+
+def _zstd_compress(body):
+    if not hasattr(_zstd_local, 'compressor'):
+        _zstd_local.compressor = zstandard.ZstdCompressor(level=3)
+    return _zstd_local.compressor.compress(body)
+
+def _zstd_decompress(body):
+    if not hasattr(_zstd_local, 'decompressor'):
+        _zstd_local.decompressor = zstandard.ZstdDecompressor()
+    return _zstd_local.decompressor.decompress(body)
+
+# content_encoding -> (compress, decompress)
+COMPRESSORS = {
+    'gzip': (lambda body: gzip.compress(body, compresslevel=6), gzip.decompress)
+}
+if zstandard:
+    COMPRESSORS['zstd'] = (_zstd_compress, _zstd_decompress)
+if lz4:
+    COMPRESSORS['lz4'] = (lz4.frame.compress, lz4.frame.decompress)
+
+def compress(body, encoding, threshold=1024):
+    """Compress bodies of at least `threshold` bytes. Returns (body, content_encoding);
+    content_encoding is None when the body is sent as-is, including when
+    compressing would not make it smaller."""
+    if not encoding or encoding == 'none':
+        return body, None
+    if encoding not in COMPRESSORS:
+        raise ValueError(f"Compression '{encoding}' is not available")
+    if len(body) < threshold:
+        compression_stats.record(len(body), len(body), 0.0, False)
+        return body, None
+
+    started = time.thread_time()
+    compressed = COMPRESSORS[encoding][0](body)
+    cpu = time.thread_time() - started
+    if len(compressed) >= len(body):
+        compression_stats.record(len(body), len(body), cpu, False)
+        return body, None
+    compression_stats.record(len(body), len(compressed), cpu, True)
+    return compressed, encoding
+
+def decompress(body, content_encoding):
+    """Undo compress() according to the message's content_encoding"""
+    if not content_encoding or content_encoding in ('identity', 'none'):
+        return body
+    if content_encoding not in COMPRESSORS:
+        raise MessageDecodeError(f"Unsupported content_encoding '{content_encoding}'")
+    started = time.thread_time()
+    try:
+        raw = COMPRESSORS[content_encoding][1](body)
+    except Exception as e:
+        raise MessageDecodeError(f"Cannot decompress {content_encoding} body: {e}") from e
+    decompression_stats.record(len(raw), len(body), time.thread_time() - started, True)
+    return raw
+
+def decode_message(body, properties):
+    """Decompress and decode a delivered message using its AMQP properties"""
+    body = decompress(body, getattr(properties, 'content_encoding', None))
+    return decode(body, getattr(properties, 'content_type', None))
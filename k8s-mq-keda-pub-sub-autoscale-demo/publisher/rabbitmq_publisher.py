@@ -0,0 +1,497 @@
+"""Synchronous pika publisher: one connection and channel per RabbitMQPublisher,
+with the confirm window used for batches and streams.
+
+Shared by publisher.py (Flask) and bench_publish.py; importing it has no side
+effects, the pool, job executor and app live in publisher.py.
+"""
+import json
+import os
+import time
+from collections import OrderedDict
+
+import pika
+
+import tracing
+from common import logger, message_ids, parse_rabbitmq_port, prepare_message, tracer
+
+# Failures that mean the connection/channel is gone and a reconnect may succeed
+RECONNECT_ERRORS = (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError)
+
+# Yielded by iter_ndjson in place of a record that failed to parse
+INVALID_RECORD = object()
+
+def iter_ndjson(stream, chunk_size=64 * 1024, max_line_bytes=1024 * 1024):
+    """Incrementally parse newline-delimited JSON from a file-like stream.
+    Only one chunk plus one partial line is held in memory at a time."""
+    buffer = b''
+    discarding = False  # skipping the rest of an over-long line
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        buffer += chunk
+        lines = buffer.split(b'\n')
+        buffer = lines.pop()
+        for line in lines:
+            if discarding:
+                discarding = False
+                continue
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield INVALID_RECORD
+        if len(buffer) > max_line_bytes:
+            if not discarding:
+                yield INVALID_RECORD
+            discarding = True
+            buffer = b''
+    
+    if buffer.strip() and not discarding:
+        try:
+            yield json.loads(buffer)
+        except ValueError:
+            yield INVALID_RECORD
+
+class ConfirmWindow:
+    """Pipelines publishes on a confirm-mode channel, keeping at most `size`
+    messages in flight and collecting broker acks/nacks as they arrive"""
+
+    def __init__(self, connection, channel, size, confirm_timeout=30.0, track_outcomes=True):
+        self.connection = connection
+        self.blocking_channel = channel
+        # BlockingChannel waits for every confirm inside basic_publish, so we drive
+        # the underlying async channel directly and pump the connection ourselves.
+        # _impl is private to pika, hence the exact pika pin in requirements.txt
+        self.channel = channel._impl
+        self.size = max(1, int(size))
+        self.confirm_timeout = confirm_timeout
+        self.flush_every = max(1, self.size // 8)
+        self.pending = OrderedDict()  # delivery_tag -> caller token, in publish order
+        self.confirm_spans = {}  # delivery_tag -> open 'confirm' span, traced messages only
+        # Streams only need counts; keeping a token per message would grow unbounded
+        self.track_outcomes = track_outcomes
+        self.outcomes = {}  # caller token -> 'ack' | 'nack' | 'timeout'
+        self.acked = 0
+        self.nacked = 0
+        self.timed_out = 0
+        self.next_delivery_tag = 1
+        self.unflushed = 0
+        
+        selected = []
+        self.channel.confirm_delivery(ack_nack_callback=self._on_confirm,
+                                      callback=lambda frame: selected.append(frame))
+        deadline = time.monotonic() + self.confirm_timeout
+        while not selected:
+            if time.monotonic() > deadline:
+                raise TimeoutError("Broker did not confirm Confirm.Select")
+            self.connection.process_data_events(time_limit=0.1)
+    
+    def _on_confirm(self, frame):
+        """Handle Basic.Ack / Basic.Nack frames, including `multiple` confirms"""
+        method = frame.method
+        outcome = 'ack' if isinstance(method, pika.spec.Basic.Ack) else 'nack'
+        if method.multiple:
+            while self.pending and next(iter(self.pending)) <= method.delivery_tag:
+                delivery_tag, token = self.pending.popitem(last=False)
+                self._record(token, outcome)
+                self._end_confirm_span(delivery_tag, outcome)
+        elif method.delivery_tag in self.pending:
+            self._record(self.pending.pop(method.delivery_tag), outcome)
+            self._end_confirm_span(method.delivery_tag, outcome)
+    
+    def _end_confirm_span(self, delivery_tag, outcome):
+        span = self.confirm_spans.pop(delivery_tag, None)
+        if span is not None:
+            span.set_attribute('messaging.confirm.outcome', outcome)
+            span.end(error=None if outcome == 'ack' else f"broker {outcome}")
+    
+    def _record(self, token, outcome):
+        if self.track_outcomes:
+            self.outcomes[token] = outcome
+        if outcome == 'ack':
+            self.acked += 1
+        else:
+            self.nacked += 1
+    
+    def _pump(self, deadline):
+        """Process I/O until at least one in-flight publish is confirmed"""
+        in_flight = len(self.pending)
+        while self.pending and len(self.pending) >= in_flight:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self.connection.process_data_events(time_limit=min(remaining, 1.0))
+        return True
+    
+    @property
+    def in_flight(self):
+        return len(self.pending)
+    
+    def publish(self, token, routing_key, body, properties, span=None):
+        """Publish one message, blocking only while the window is full. A 'publish'
+        span is ended once the message is written, and a child 'confirm' span
+        covers the wait for the broker's ack."""
+        while len(self.pending) >= self.size:
+            if not self._pump(time.monotonic() + self.confirm_timeout):
+                raise TimeoutError(f"No publisher confirms received within {self.confirm_timeout}s")
+        
+        self.channel.basic_publish(exchange='', routing_key=routing_key, body=body, properties=properties)
+        self.pending[self.next_delivery_tag] = token
+        if span is not None:
+            span.end()
+            if span.context is not None:
+                self.confirm_spans[self.next_delivery_tag] = tracer.start_span(
+                    'confirm', parent=span, kind=tracing.CLIENT)
+        self.next_delivery_tag += 1
+        
+        # Flush periodically so the broker sees a steady stream rather than
+        # one burst each time the window fills up
+        self.unflushed += 1
+        if self.unflushed >= self.flush_every:
+            self.connection.process_data_events(time_limit=0)
+            self.unflushed = 0
+    
+    def wait_for_confirms(self):
+        """Wait for all in-flight publishes; anything left unconfirmed times out"""
+        deadline = time.monotonic() + self.confirm_timeout
+        while self.pending and self._pump(deadline):
+            pass
+        while self.pending:
+            delivery_tag, token = self.pending.popitem(last=False)
+            if self.track_outcomes:
+                self.outcomes[token] = 'timeout'
+            self.timed_out += 1
+            self._end_confirm_span(delivery_tag, 'timeout')
+        return self.acked, self.nacked
+    
+    def close(self):
+        # Confirms that never arrived (aborted batch) still close their spans
+        for span in self.confirm_spans.values():
+            span.end(error="channel closed before confirm")
+        self.confirm_spans.clear()
+        try:
+            if self.blocking_channel.is_open:
+                self.blocking_channel.close()
+        except Exception:
+            pass
+
+class RabbitMQPublisher:
+    def __init__(self):
+        # Handle Kubernetes environment variables properly
+        self.rabbitmq_host = os.getenv('RABBITMQ_HOST', 'rabbitmq')
+        
+        # Parse port from potentially complex format
+        rabbitmq_port_env = os.getenv('RABBITMQ_PORT', '5672')
+        self.rabbitmq_port = parse_rabbitmq_port(rabbitmq_port_env)
+        
+        self.rabbitmq_username = os.getenv('RABBITMQ_USERNAME', 'admin')
+        self.rabbitmq_password = os.getenv('RABBITMQ_PASSWORD', 'admin123')
+        self.queue_name = os.getenv('QUEUE_NAME', 'work_queue')
+        
+        # Publisher confirms for batches: 0 keeps the original one-at-a-time path
+        self.confirm_window = int(os.getenv('PUBLISH_CONFIRM_WINDOW', '0'))
+        self.confirm_timeout = float(os.getenv('PUBLISH_CONFIRM_TIMEOUT', '30'))
+        self.heartbeat = int(os.getenv('RABBITMQ_HEARTBEAT', '60'))
+        
+        self.connection = None
+        self.channel = None
+        self.message_count = 0
+        self.reconnects = 0
+        self.last_activity = time.monotonic()
+        
+        logger.info(f"Publisher initialized - Host: {self.rabbitmq_host}, Port: {self.rabbitmq_port}, Queue: {self.queue_name}")
+        logger.info(f"Raw RABBITMQ_PORT env: {rabbitmq_port_env}")
+        
+    def connect(self):
+        """Connect to RabbitMQ"""
+        try:
+            if self.connection and not self.connection.is_closed:
+                return True
+                
+            logger.info(f"Connecting to RabbitMQ at {self.rabbitmq_host}:{self.rabbitmq_port}")
+            
+            credentials = pika.PlainCredentials(self.rabbitmq_username, self.rabbitmq_password)
+            parameters = pika.ConnectionParameters(
+                host=self.rabbitmq_host,
+                port=self.rabbitmq_port,
+                credentials=credentials,
+                connection_attempts=3,
+                retry_delay=2,
+                socket_timeout=10,
+                heartbeat=self.heartbeat,
+                blocked_connection_timeout=300
+            )
+            
+            self.connection = pika.BlockingConnection(parameters)
+            self.channel = self.connection.channel()
+            
+            # Declare queue
+            self.channel.queue_declare(queue=self.queue_name, durable=True)
+            
+            logger.info("Successfully connected to RabbitMQ and declared queue")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to connect to RabbitMQ: {e}")
+            self.connection = None
+            self.channel = None
+            return False
+    
+    def ensure_connection(self):
+        """Ensure we have a working connection"""
+        try:
+            if self.connection is None or self.connection.is_closed:
+                return self.connect()
+            
+            # Test the connection
+            self.connection.process_data_events(time_limit=0)
+            return True
+            
+        except Exception as e:
+            logger.warning(f"Connection test failed, reconnecting: {e}")
+            return self.connect()
+    
+    def build_message(self, message_data, message_id, content_type=None, span=None):
+        """Return the message body and pika properties"""
+        body, properties = prepare_message(message_data, message_id, content_type, span)
+        return body, pika.BasicProperties(**properties)
+    
+    def reset_connection(self):
+        """Drop the current connection so the next call reconnects"""
+        try:
+            if self.connection:
+                self.connection.close()
+        except:
+            pass
+        self.connection = None
+        self.channel = None
+    
+    def service_heartbeat(self):
+        """Let pika send/receive heartbeats on an idle connection. Called by the
+        pool's liveness tracker, never from the publish path."""
+        if self.connection is None:
+            return True
+        try:
+            self.connection.process_data_events(time_limit=0)
+            self.last_activity = time.monotonic()
+            return True
+        except Exception as e:
+            logger.warning(f"Idle connection failed liveness check: {e}")
+            self.reset_connection()
+            return False
+    
+    def start_publish_span(self):
+        return tracer.start_span('publish', kind=tracing.PRODUCER,
+                                 attributes={'messaging.destination.name': self.queue_name})
+    
+    def publish_message(self, message_data, content_type=None):
+        """Publish a single message to RabbitMQ"""
+        span = self.start_publish_span()
+        body, properties = self.build_message(message_data, next(message_ids), content_type, span)
+        
+        # Hot path is serialization plus basic_publish. Liveness is tracked in the
+        # background, so a dead connection only shows up here as a publish error,
+        # which triggers one reconnect and retry.
+        for attempt in range(2):
+            try:
+                if self.channel is None and not self.connect():
+                    logger.error("Cannot establish connection to RabbitMQ")
+                    span.end(error="no connection")
+                    return False
+                
+                # Publish the message
+                self.channel.basic_publish(
+                    exchange='',
+                    routing_key=self.queue_name,
+                    body=body,
+                    properties=properties
+                )
+                
+                self.message_count += 1
+                self.last_activity = time.monotonic()
+                span.end()
+                logger.info(f"Successfully published message {self.message_count}: {message_data}")
+                return True
+                
+            except RECONNECT_ERRORS as e:
+                logger.warning(f"Publish failed on a dead connection, reconnecting: {e}")
+                self.reset_connection()
+                self.reconnects += 1
+                
+            except Exception as e:
+                logger.error(f"Error publishing message: {e}")
+                # Reset connection on error
+                self.reset_connection()
+                span.end(error=e)
+                return False
+        
+        logger.error("Error publishing message: retry after reconnect failed")
+        span.end(error="retry after reconnect failed")
+        return False
+    
+    def get_queue_status(self):
+        """Get current queue statistics"""
+        try:
+            if not self.ensure_connection():
+                logger.error("Cannot connect to get queue status")
+                return None
+            
+            method = self.channel.queue_declare(queue=self.queue_name, durable=True, passive=True)
+            return {
+                'queue_name': self.queue_name,
+                'message_count': method.method.message_count,
+                'consumer_count': method.method.consumer_count
+            }
+        except Exception as e:
+            logger.error(f"Error getting queue status: {e}")
+            return None
+    
+    def publish_batch(self, messages, delay_seconds=0.5, confirm_window=None, progress=None, rate_limiter=None,
+                      content_type=None):
+        """Publish multiple messages. `progress(sent, successful, failed)` is
+        called after each message when given. A rate limiter, when given,
+        paces the batch instead of the fixed delay."""
+        if confirm_window is None:
+            confirm_window = self.confirm_window
+        if rate_limiter:
+            delay_seconds = 0
+        if confirm_window > 0:
+            return self.publish_batch_confirmed(messages, confirm_window, delay_seconds, progress, rate_limiter,
+                                                content_type)
+        
+        successful = 0
+        failed = 0
+        
+        for i, message in enumerate(messages):
+            if rate_limiter:
+                rate_limiter.acquire()
+            if self.publish_message(message, content_type):
+                successful += 1
+            else:
+                failed += 1
+            if progress:
+                progress(i + 1, successful, failed)
+            
+            if delay_seconds > 0 and i < len(messages) - 1:
+                time.sleep(delay_seconds)
+        
+        logger.info(f"Batch complete: {successful} successful, {failed} failed")
+        return {'successful': successful, 'failed': failed}
+    
+    def publish_batch_confirmed(self, messages, window_size, delay_seconds=0, progress=None, rate_limiter=None,
+                                content_type=None):
+        """Publish a batch with publisher confirms, keeping up to `window_size`
+        unconfirmed messages in flight. Returns per-message outcomes."""
+        outcomes = ['error'] * len(messages)
+        if not self.ensure_connection():
+            logger.error("Cannot establish connection to RabbitMQ")
+            return {'successful': 0, 'failed': len(messages), 'outcomes': outcomes}
+        
+        window = None
+        started = time.time()
+        try:
+            window = ConfirmWindow(self.connection, self.connection.channel(), window_size, self.confirm_timeout)
+            for i, message in enumerate(messages):
+                if rate_limiter:
+                    rate_limiter.acquire()
+                span = self.start_publish_span()
+                body, properties = self.build_message(message, next(message_ids), content_type, span)
+                window.publish(i, self.queue_name, body, properties, span)
+                self.message_count += 1
+                if progress:
+                    progress(i + 1, window.acked, window.nacked)
+                
+                if delay_seconds > 0 and i < len(messages) - 1:
+                    time.sleep(delay_seconds)
+            window.wait_for_confirms()
+        except Exception as e:
+            logger.error(f"Confirmed batch aborted: {e}")
+            self.reset_connection()
+        finally:
+            if window:
+                window.close()
+        
+        if window:
+            # Anything still pending when the batch aborted stays 'error'
+            for i, outcome in window.outcomes.items():
+                outcomes[i] = outcome
+        successful = outcomes.count('ack')
+        failed = len(outcomes) - successful
+        elapsed = time.time() - started
+        rate = successful / elapsed if elapsed > 0 else 0
+        
+        logger.info(f"Confirmed batch complete: {successful} acked, {failed} failed "
+                    f"(window={window_size}, {rate:.0f} msgs/s)")
+        return {
+            'successful': successful,
+            'failed': failed,
+            'nacked': outcomes.count('nack'),
+            'timed_out': outcomes.count('timeout'),
+            'messages_per_second': round(rate, 1),
+            'outcomes': outcomes
+        }
+    
+    def publish_stream(self, records, window_size=None, content_type=None):
+        """Publish records from an iterator as they arrive. The confirm window is
+        the backpressure: while it is full we stop pulling records, so the client
+        is throttled by TCP instead of the body being buffered here."""
+        window_size = window_size or self.confirm_window or 1000
+        summary = {'received': 0, 'parse_errors': 0}
+        if not self.ensure_connection():
+            logger.error("Cannot establish connection to RabbitMQ")
+            return None
+        
+        window = None
+        started = time.time()
+        try:
+            window = ConfirmWindow(self.connection, self.connection.channel(), window_size,
+                                   self.confirm_timeout, track_outcomes=False)
+            for record in records:
+                if record is INVALID_RECORD:
+                    summary['parse_errors'] += 1
+                    continue
+                summary['received'] += 1
+                span = self.start_publish_span()
+                body, properties = self.build_message(record, next(message_ids), content_type, span)
+                window.publish(None, self.queue_name, body, properties, span)
+                self.message_count += 1
+            window.wait_for_confirms()
+        except Exception as e:
+            logger.error(f"Stream publish aborted after {summary['received']} records: {e}")
+            summary['error'] = str(e)
+            self.reset_connection()
+        finally:
+            if window:
+                window.close()
+        
+        acked = window.acked if window else 0
+        elapsed = time.time() - started
+        summary.update({
+            'successful': acked,
+            'failed': summary['received'] - acked,
+            'nacked': window.nacked if window else 0,
+            'timed_out': window.timed_out if window else 0,
+            'confirm_window': window_size,
+            'elapsed_seconds': round(elapsed, 3),
+            'messages_per_second': round(acked / elapsed, 1) if elapsed > 0 else 0
+        })
+        logger.info(f"Stream complete: {summary['received']} received, {acked} acked, "
+                    f"{summary['parse_errors']} unparseable ({summary['messages_per_second']:.0f} msgs/s)")
+        return summary
+    
+    def test_connection(self):
+        """Test the connection and return status"""
+        try:
+            if self.connect():
+                status = self.get_queue_status()
+                if status:
+                    return True, f"Connection successful. Queue has {status['message_count']} messages."
+                else:
+                    return True, "Connection successful but couldn't get queue status."
+            else:
+                return False, "Failed to connect to RabbitMQ"
+        except Exception as e:
+            return False, f"Connection test failed: {e}"
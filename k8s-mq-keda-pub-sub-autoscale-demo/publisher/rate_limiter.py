@@ -0,0 +1,212 @@
+import math
+import threading
+import time
+
+# ========================
+# RATE PROFILES
+# ========================
+# A profile maps seconds since the limiter was configured to a target rate
+# (msgs/s). Being a pure function of elapsed time, the same spec always
+# produces the same load shape.
+
+def constant_profile(rate):
+    return lambda t: rate
+
+def linear_profile(start_rate, end_rate, ramp_seconds):
+    """Ramp from start_rate to end_rate over ramp_seconds, then hold end_rate"""
+    def profile(t):
+        if ramp_seconds <= 0 or t >= ramp_seconds:
+            return end_rate
+        return start_rate + (end_rate - start_rate) * t / ramp_seconds
+    return profile
+
+def step_profile(rates, step_seconds, repeat=False):
+    """Hold each rate for step_seconds; after the last step hold it or start over"""
+    def profile(t):
+        index = int(t // step_seconds) if step_seconds > 0 else len(rates) - 1
+        if repeat:
+            index %= len(rates)
+        return rates[min(index, len(rates) - 1)]
+    return profile
+
+def sine_profile(mean_rate, amplitude, period_seconds):
+    """Oscillate around mean_rate, never below zero"""
+    def profile(t):
+        return max(0.0, mean_rate + amplitude * math.sin(2 * math.pi * t / period_seconds))
+    return profile
+
+def _positive(value, what):
+    # A profile that reaches 0 msgs/s would leave acquire() waiting for tokens forever
+    value = float(value)
+    if not value > 0:
+        raise ValueError(f"{what} must be positive, got {value:g}")
+    return value
+
+def build_profile(spec):
+    """Build a profile from a request spec, e.g.
+    {"profile": "linear", "start_rate": 10, "rate": 500, "ramp_seconds": 60}.
+    Every rate the profile can reach must be positive."""
+    kind = spec.get('profile', 'constant')
+    if kind == 'constant':
+        return constant_profile(_positive(spec.get('rate', 0), "rate"))
+    if kind == 'linear':
+        return linear_profile(_positive(spec.get('start_rate', 1), "start_rate"),
+                              _positive(spec.get('rate', 0), "rate"), float(spec.get('ramp_seconds', 60)))
+    if kind == 'step':
+        rates = [_positive(r, "every step rate") for r in spec.get('rates', [spec.get('rate', 0)])]
+        if not rates:
+            raise ValueError("step profile needs at least one rate")
+        return step_profile(rates, float(spec.get('step_seconds', 30)), bool(spec.get('repeat', False)))
+    if kind == 'sine':
+        rate = _positive(spec.get('rate', 0), "rate")
+        amplitude = float(spec.get('amplitude', rate / 2))
+        _positive(rate - abs(amplitude), "rate - amplitude")
+        period = float(spec.get('period_seconds', 120))
+        if period <= 0:
+            raise ValueError("sine profile needs a positive period_seconds")
+        return sine_profile(rate, amplitude, period)
+    raise ValueError(f"Unknown rate profile '{kind}'")
+
+# ========================
+# TOKEN BUCKET
+# ========================
+class TokenBucket:
+    """Thread-safe token bucket. Tokens refill at the profile's current rate up
+    to `burst`; every publisher thread sharing the bucket draws from it, so the
+    combined rate of concurrent jobs follows the profile."""
+
+    # Longest single sleep, so rate changes from the profile are picked up quickly
+    MAX_SLEEP = 0.05
+    # acquire() gives up after this long rather than holding a publisher forever
+    DEFAULT_TIMEOUT = 300.0
+
+    def __init__(self, name, spec, clock=time.monotonic, sleep=time.sleep):
+        self.name = name
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.configure(spec)
+
+    def configure(self, spec):
+        """(Re)configure rate, burst and profile; restarts the profile clock"""
+        profile = build_profile(spec)
+        rate = float(spec.get('rate', 0))
+        # Default burst: roughly 100ms worth of messages at the target rate
+        burst = float(spec.get('burst', max(1.0, rate / 10)))
+        if burst < 1:
+            raise ValueError("burst must be at least 1")
+        with self.lock:
+            self.spec = dict(spec)
+            self.profile = profile
+            self.burst = burst
+            self.started = self.clock()
+            self.last_refill = self.started
+            self.tokens = burst
+            self.acquired = 0
+            self.total_wait = 0.0
+
+    def current_rate(self, now=None):
+        now = self.clock() if now is None else now
+        return self.profile(now - self.started)
+
+    def _refill(self, now):
+        elapsed = now - self.last_refill
+        if elapsed > 0:
+            self.tokens = min(self.burst, self.tokens + elapsed * self.current_rate(now))
+            self.last_refill = now
+
+    def acquire(self, count=1, timeout=None):
+        """Block until `count` tokens are available; returns seconds waited.
+        Raises TimeoutError if they aren't available within `timeout` seconds."""
+        timeout = self.DEFAULT_TIMEOUT if timeout is None else timeout
+        started = self.clock()
+        while True:
+            with self.lock:
+                now = self.clock()
+                if count > self.burst:
+                    raise ValueError(f"Cannot acquire {count} tokens from a bucket of {self.burst:g}")
+                self._refill(now)
+                if self.tokens >= count:
+                    self.tokens -= count
+                    self.acquired += count
+                    waited = now - started
+                    self.total_wait += waited
+                    return waited
+                rate = self.current_rate(now)
+                shortfall = count - self.tokens
+            if now - started >= timeout:
+                raise TimeoutError(f"Rate limiter '{self.name}' had no token within {timeout:g}s")
+            wait = shortfall / rate if rate > 0 else self.MAX_SLEEP
+            self.sleep(min(wait, self.MAX_SLEEP))
+
+    def get_stats(self):
+        with self.lock:
+            now = self.clock()
+            elapsed = now - self.started
+            return {
+                'name': self.name,
+                'spec': self.spec,
+                'current_target_rate': round(self.current_rate(now), 3),
+                'burst': self.burst,
+                'tokens_available': round(min(self.burst, self.tokens), 3),
+                'acquired': self.acquired,
+                'average_rate': round(self.acquired / elapsed, 3) if elapsed > 0 else 0.0,
+                'total_wait_seconds': round(self.total_wait, 3)
+            }
+
+class RateLimiterConflict(ValueError):
+    """A batch spec names an existing limiter but asks for a different configuration"""
+
+class RateLimiterRegistry:
+    """Named token buckets; jobs naming the same limiter share its rate"""
+
+    def __init__(self):
+        self.limiters = {}
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        with self.lock:
+            return self.limiters.get(name)
+
+    def configure(self, spec):
+        """Create the limiter named in `spec` (default 'default'), or reconfigure it"""
+        if isinstance(spec, (int, float)):
+            spec = {'rate': spec}
+        name = spec.get('limiter', 'default')
+        with self.lock:
+            limiter = self.limiters.get(name)
+            if limiter is None:
+                limiter = self.limiters[name] = TokenBucket(name, spec)
+                return limiter
+        limiter.configure(spec)
+        return limiter
+
+    def resolve(self, spec):
+        """Limiter for a batch request: a bare name reuses an existing limiter as
+        configured, a number or dict creates one. A spec naming an existing limiter
+        must match its configuration; retuning a limiter that running jobs share is
+        left to configure() (PUT /rate-limiters/<name>)."""
+        if spec is None:
+            return None
+        if isinstance(spec, str):
+            limiter = self.get(spec)
+            if limiter is None:
+                raise ValueError(f"Unknown rate limiter '{spec}'")
+            return limiter
+        if isinstance(spec, (int, float)):
+            spec = {'rate': spec}
+        name = spec.get('limiter', 'default')
+        with self.lock:
+            limiter = self.limiters.get(name)
+            if limiter is None:
+                limiter = self.limiters[name] = TokenBucket(name, spec)
+                return limiter
+        if dict(spec, limiter=name) != dict(limiter.spec, limiter=name):
+            raise RateLimiterConflict(f"Rate limiter '{name}' already exists with a different configuration; "
+                                      f"use it by name or retune it with PUT /rate-limiters/{name}")
+        return limiter
+
+    def get_stats(self):
+        with self.lock:
+            limiters = list(self.limiters.values())
+        return [limiter.get_stats() for limiter in limiters]